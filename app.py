@@ -4,10 +4,18 @@ It contains the definition of routes and views for the application.
 """
 from re import search
 from typing import Tuple
+from bisect import bisect_left, bisect_right
+import base64
+import json
+import os
+import uuid
 import schedule
 import parse
+import workspace
+import jobs
+import solver
 from datetime import datetime
-from flask import Flask, render_template, request, session, redirect, url_for
+from flask import Flask, Response, abort, jsonify, render_template, request, session, redirect, url_for, stream_with_context
 
 app = Flask(__name__)
 app.secret_key = "secret"
@@ -44,15 +52,33 @@ selectedSessions = list[schedule.Session]()
 selectedRooms = list[schedule.Room]()
 '''
 
-speakers = None
-sessions = None
-rooms = None
-days = None
-start_times= None
-end_times = None
-day_schedule = None
-selectedSessions = None
-selectedRooms = None
+# Each planner works in their own workspace, found through an ID kept in the Flask session. Set WORKSPACE_DB to a
+# SQLite path to keep workspaces across restarts and share them between worker processes.
+workspaces = workspace.WorkspaceStore(int(os.environ.get('WORKSPACE_CACHE_SIZE', '32')), os.environ.get('WORKSPACE_DB'))
+
+# Set SCHEDULER_METRICS to count why placements are rejected and time the phases of every scheduling job.
+# The totals of the process are served by /metrics.
+schedulerMetrics = schedule.Metrics() if os.environ.get('SCHEDULER_METRICS') else None
+
+# Step 4 generates schedules in background jobs so long solver runs do not hold up a request.
+# Jobs live in the process that started them.
+jobManager = jobs.JobManager(workspaces, int(os.environ.get('JOB_WORKERS', '2')), metrics=schedulerMetrics)
+
+
+def getWorkspace() -> workspace.Workspace:
+    """Returns the workspace of the planner making the request, giving new planners a workspace ID."""
+
+    if 'workspaceId' not in session:
+        session['workspaceId'] = uuid.uuid4().hex
+
+    return workspaces.get(session['workspaceId'])
+
+
+
+def saveWorkspace(ws: workspace.Workspace):
+    """Stores the workspace of the planner making the request after it has changed."""
+
+    workspaces.save(session['workspaceId'], ws)
 
 
 def makeChecked(all: list[str], selected: list[str]) -> dict[(str, str)]:
@@ -68,6 +94,16 @@ def makeChecked(all: list[str], selected: list[str]) -> dict[(str, str)]:
     
 
 
+def parseSlotValue(value: str):
+    """Converts a submitted date or time to a datetime, or to an index if the form sent one."""
+
+    if value.isdigit():
+        return int(value)
+
+    return datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
+
+
+
 @app.route('/', methods = ['POST', 'GET'])
 def main():
     """Defines the entry point of the application."""
@@ -81,34 +117,25 @@ def stepZero():
     For POST requests, stores the Step0 form data in the session and renders the Step1 page. """
 
     if request.method == 'POST':
-        global day_schedule
-        global selectedRooms
-        global selectedSessions
-        global start_times
-        global end_times
-        global speakers 
-        global days
-
-        d = request.form['datesInput']
-        days = parse.parseDays(d)
-
-        s = request.form['speakersInput']  
-        speakers = parse.parseSpeakers(s)
-         
-        t = request.form['timeInput']
-        start_times, end_times = parse.parseTime(t)
-
-        r = request.form['roomsInput']
-        rooms = parse.parseRooms(r)
-
-        s1 = request.form['sessionsInput']
-        sessions = parse.parseSession(s1)
+        # files that were uploaded before are loaded from the parse cache; parsing stops at the first
+        # missing column or malformed row and reports it to the planner
+        try:
+            d = request.form['datesInput']
+            s = request.form['speakersInput']  
+            t = request.form['timeInput']
+            r = request.form['roomsInput']
+            s1 = request.form['sessionsInput']
+
+            days, speakers, session_speakers, start_times, end_times, rooms, sessions = parse.parseInputs(d, s, t, r, s1)
+        except (parse.ParseError, OSError) as err:
+            abort(400, description=str(err))
         
-        day_schedule = schedule.Schedule(start_times, end_times, days, sessions, rooms, speakers)
-        day_schedule.init()
-
-        selectedSessions = list[schedule.Session]()
-        selectedRooms = list[schedule.Room]()
+        ws = getWorkspace()
+        ws.day_schedule = schedule.Schedule(start_times, end_times, days, sessions, rooms, speakers, session_speakers=session_speakers)
+        ws.day_schedule.init()
+        ws.selected_sessions = list[schedule.Session]()
+        ws.selected_rooms = list[schedule.Room]()
+        saveWorkspace(ws)
 
         return redirect(url_for('stepOne'))
 
@@ -121,6 +148,14 @@ def stepZero():
 def stepOne():       
     """Render the 'Step 1' page or redirect to the 'Step 2' page."""
 
+    ws = getWorkspace()
+    if ws.day_schedule is None:
+        return redirect(url_for('stepZero'))
+
+    day_schedule = ws.day_schedule
+    selectedSessions = ws.selected_sessions
+    selectedRooms = ws.selected_rooms
+
     # The user has submitted form data.
     # Reload Step 1 to update the page in response to user selections (apply the selected filters )
     # or navigate to Step 2.
@@ -144,8 +179,13 @@ def stepOne():
             sessionTypes = makeChecked(list(day_schedule.get_session_types()), session['selectedTypes'])
             sessionSponsors = makeChecked(list(day_schedule.get_session_sponsors()), session['selectedSponsors'])
 
+            # number of sessions each filter value would match given the other selected filters
+            facetCounts = day_schedule.get_facet_counts(session["selectedTypes"], session["selectedSessFormats"],
+                                                        session['selectedSponsors'], session['selectedTopics'])
+
             return render_template('Step1.html', unscheduled_sessions=unscheduledSessions, sessFormats=sessionFormats, 
-                                                 topics=sessionTopics, types=sessionTypes, sponsors=sessionSponsors)
+                                                 topics=sessionTopics, types=sessionTypes, sponsors=sessionSponsors,
+                                                 counts=facetCounts)
 
 
         # Navigating to the next page (Step 2).
@@ -153,9 +193,9 @@ def stepOne():
             # get the session objects corresponding to the selected sessions 
             selectedSessions.clear()
             for i in request.form.getlist('selectedSessions', type=int):
-                for sess in day_schedule.get_unscheduled_sessions():
-                    if i == sess.session_id:
-                        selectedSessions.append(sess)
+                if day_schedule.is_unscheduled(i):
+                    selectedSessions.append(day_schedule.get_session(i))
+            saveWorkspace(ws)
             
             return redirect(url_for('stepTwo'))
         
@@ -168,9 +208,11 @@ def stepOne():
         sessionTopics = dict.fromkeys(list(day_schedule.get_session_topics()), "")
         sessionTypes = dict.fromkeys(list(day_schedule.get_session_types()), "")
         sessionSponsors = dict.fromkeys(list(day_schedule.get_session_sponsors()), "")
+        facetCounts = day_schedule.get_facet_counts([], [], [], [])
         
         return render_template('Step1.html', unscheduled_sessions=unscheduledSessions, sessFormats=sessionFormats, 
-                                             topics=sessionTopics, types=sessionTypes, sponsors=sessionSponsors)
+                                             topics=sessionTopics, types=sessionTypes, sponsors=sessionSponsors,
+                                             counts=facetCounts)
 
 
 
@@ -180,11 +222,25 @@ def stepTwo():
     """ Renders the Step2 page. 
     For POST requests, stores the Step2 form data in the session and renders the Step3 page. """
 
+    ws = getWorkspace()
+    if ws.day_schedule is None:
+        return redirect(url_for('stepZero'))
+
+    day_schedule = ws.day_schedule
+
     # Dates and times have been selected, navigating to Step 3
     if request.method == 'POST':
-        # convert the selected dates and times to datetime objects & store in session state
-        session["selectedDates"] = [datetime.strptime(date, '%Y-%m-%d %H:%M:%S') for date in request.form.getlist('selectedDates')]
-        session["selectedTimes"] = [datetime.strptime(time, '%Y-%m-%d %H:%M:%S') for time in request.form.getlist('selectedTimes')]       
+        # convert the selected dates and times to datetime objects or indexes
+        selectedDates = [parseSlotValue(date) for date in request.form.getlist('selectedDates')]
+        selectedTimes = [parseSlotValue(time) for time in request.form.getlist('selectedTimes')]
+
+        # store indexes rather than datetimes so they survive the session cookie unchanged,
+        # rejecting dates and times that are not part of the schedule
+        try:
+            session["selectedDates"] = [day_schedule.get_day_index(date) for date in selectedDates]
+            session["selectedTimes"] = [day_schedule.get_slot_index(time) for time in selectedTimes]
+        except ValueError as err:
+            abort(400, description=str(err))
 
         return redirect(url_for('stepThree'))
 
@@ -199,6 +255,14 @@ def stepTwo():
 def stepThree():
     """Renders the 'Step 1' page or redirect to the 'Step 2' page."""
 
+    ws = getWorkspace()
+    if ws.day_schedule is None:
+        return redirect(url_for('stepZero'))
+
+    day_schedule = ws.day_schedule
+    selectedSessions = ws.selected_sessions
+    selectedRooms = ws.selected_rooms
+
     # The user has submitted form data.
     # Reload Step 3 to update the page in response to user selections (apply the selected filters)
     # or navigate to Step 4.
@@ -236,12 +300,17 @@ def stepThree():
             
         # Navigating to the next page (Step 4).
         elif 'nextStep' in request.form:                  
+            # store the scheduler backend and its time limit used by Step 4
+            session["solver"] = request.form.get('solver', 'greedy')
+            session["timeLimit"] = request.form.get('timeLimit', 10.0, type=float)
+
             # get the room objects corresponding to the selected rooms   
             selectedRooms.clear() 
             for i in request.form.getlist('selectedRooms', type=int):
                 for room in day_schedule.all_rooms:
                     if i == room.room_id:
                         selectedRooms.append(room)
+            saveWorkspace(ws)
                           
             return redirect(url_for('stepFour'))
 
@@ -277,22 +346,286 @@ def stepThree():
 @app.route('/StepFour', methods = ['POST', 'GET'])
 def stepFour():
     """ Renders the Step4 page. """
+
+    ws = getWorkspace()
+    if ws.day_schedule is None:
+        return redirect(url_for('stepZero'))
+
+    day_schedule = ws.day_schedule
+
     if request.method == 'POST':    
-        # Save the generated schedule as a CSV file   
-      
-        return render_template('Step4.html', schedule=day_schedule.get_scheduled_sessions()) 
+        # Stream the generated schedule to the browser as CSV, Parquet or Arrow IPC, chunk by chunk
+        format = request.form.get('format', 'csv')
+
+        try:
+            chunks = parse.iterExport(list(day_schedule.get_scheduled_sessions()), format)
+        except (ValueError, ImportError) as err:
+            abort(400, description=str(err))
+
+        mimetype, extension = parse.EXPORT_FORMATS[format]
+        return Response(stream_with_context(chunks), mimetype=mimetype,
+                        headers={'Content-Disposition': f'attachment; filename=schedule.{extension}'})
 
     else:
-        day_schedule.create_schedule(selectedSessions, selectedRooms, 
-                                    session["selectedDates"], session["selectedTimes"])
+        jobId = request.args.get('job')
+
+        # Start a job and come back to this page with its ID, so reloading the page does not start another one.
+        # The backend may also be picked with the 'solver' and 'timeLimit' query arguments.
+        if jobId is None:
+            backend = request.args.get('solver', session.get('solver', 'greedy'))
+            timeLimit = request.args.get('timeLimit', session.get('timeLimit', 10.0), type=float)
+
+            if backend not in solver.BACKENDS:
+                abort(400, description=f"Unknown solver backend '{backend}', expected one of {', '.join(solver.BACKENDS)}")
+
+            job = jobManager.get_running(session['workspaceId'])
+            if job is None:
+                job = jobManager.submit(session['workspaceId'], backend, 
+                                        session.get("selectedDates", []), session.get("selectedTimes", []),
+                                        timeLimit)
+
+            return redirect(url_for('stepFour', job=job.job_id))
+
+        job = jobManager.get(jobId, session['workspaceId'])
+        if job is None:
+            abort(404, description='Unknown scheduling job')
+
+        # While the job runs the page polls its progress and reloads once it has finished
+        return render_template('Step4.html', schedule=ws.day_schedule.get_scheduled_sessions(), job=job, result=job.result) 
+
+
+
+@app.route('/jobs/<jobId>', methods = ['GET'])
+def jobStatus(jobId: str):
+    """Returns the progress of a scheduling job as JSON, including its result once it is done."""
+
+    job = jobManager.get(jobId, session.get('workspaceId'))
+    if job is None:
+        abort(404, description='Unknown scheduling job')
+
+    return jsonify(job.to_json())
+
+
+
+@app.route('/jobs/<jobId>/cancel', methods = ['POST'])
+def cancelJob(jobId: str):
+    """Cancels a scheduling job. The workspace keeps the schedule it had before the job started."""
+
+    job = jobManager.get(jobId, session.get('workspaceId'))
+    if job is None:
+        abort(404, description='Unknown scheduling job')
+
+    job.cancel()
+    return jsonify(job.to_json())
+
+
+
+
+# Fields the JSON API can sort sessions and rooms by. Ties are broken by ID, which also makes the cursor of
+# a page point at a single item.
+SESSION_SORT_KEYS = {
+    'id': lambda sess: sess.session_id,
+    'title': lambda sess: sess.title,
+    'format': lambda sess: sess.format,
+    'type': lambda sess: sess.type,
+    'topic': lambda sess: sess.topic,
+    'capacity': lambda sess: sess.est_capacity,
+    'duration': lambda sess: sess.duration,
+}
+
+ROOM_SORT_KEYS = {
+    'id': lambda entry: entry[0].room_id,
+    'name': lambda entry: entry[0].name,
+    'property': lambda entry: entry[0].property,
+    'format': lambda entry: entry[0].format,
+    'capacity': lambda entry: entry[0].max_capacity,
+    'available': lambda entry: entry[1],
+}
+
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 500
+
+
+def sessionToJson(sess: schedule.Session) -> dict:
+    """Converts an unscheduled session to the form served by the JSON API."""
+
+    return {'id': sess.session_id, 'title': sess.title, 'format': sess.format, 'type': sess.type,
+            'topic': sess.topic, 'sponsors': [sponsor for sponsor in sess.sponsors if sponsor != ''],
+            'equipment': [item for item in sess.equipment if item != ''], 'speakers': sess.speaker,
+            'capacity': sess.est_capacity, 'duration': sess.duration}
+
+
+
+def roomToJson(entry: tuple[schedule.Room, int]) -> dict:
+    """Converts a room and its number of free slots to the form served by the JSON API."""
+
+    room, available = entry
+    return {'id': room.room_id, 'name': room.name, 'property': room.property, 'floor': room.floor,
+            'format': room.format, 'capacity': room.max_capacity, 'equipment': room.equipment,
+            'available': available}
+
+
+
+def paginate(items: list, sortKeys: dict, idKey, toJson, defaultSort: str = 'id'):
+    """Sorts items by the 'sort' query argument (a field name, '-' first for descending order) and returns
+    the page after the 'cursor' argument as a conditional JSON response. The cursor names the last item of the
+    previous page, so pages stay consistent when items before it are scheduled or removed. The ETag is a hash
+    of the page, so a client that sends it back in If-None-Match gets 304 Not Modified when nothing changed."""
+
+    sort = request.args.get('sort', defaultSort)
+    field = sort.lstrip('-')
+    descending = sort.startswith('-')
+    limit = min(max(request.args.get('limit', API_PAGE_SIZE, type=int), 1), API_MAX_PAGE_SIZE)
+
+    if field not in sortKeys:
+        abort(400, description=f"Unknown sort field '{field}', expected one of {', '.join(sortKeys)}")
+
+    def keyOf(item):
+        return (sortKeys[field](item), idKey(item))
+
+    items = sorted(items, key=keyOf)
+    keys = [keyOf(item) for item in items]
+
+    # The cursor holds the sort order and the key of the last item of the previous page
+    after = None
+    if request.args.get('cursor'):
+        try:
+            cursorSort, value, id = json.loads(base64.urlsafe_b64decode(request.args['cursor']))
+            if cursorSort != sort:
+                raise ValueError('the cursor belongs to another sort order')
+            after = (value, id)
+            position = bisect_left(keys, after) if descending else bisect_right(keys, after)
+        except (ValueError, TypeError) as err:
+            abort(400, description=f'Invalid cursor: {err}')
+
+    if descending:
+        end = position if after is not None else len(items)
+        start = max(end - limit, 0)
+        page = items[start:end][::-1]
+        hasMore = start > 0
+    else:
+        start = position if after is not None else 0
+        page = items[start:start + limit]
+        hasMore = start + limit < len(items)
+
+    nextCursor = None
+    if hasMore and page:
+        nextCursor = base64.urlsafe_b64encode(json.dumps([sort, *keyOf(page[-1])]).encode()).decode()
+
+    response = jsonify({'items': [toJson(item) for item in page], 'total': len(items), 'nextCursor': nextCursor})
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+
+@app.route('/api/sessions', methods = ['GET'])
+def apiSessions():
+    """Returns a page of the unscheduled sessions that match the Step 1 filters, which are passed as repeated
+    query arguments with the names of the Step 1 form fields."""
+
+    ws = getWorkspace()
+    if ws.day_schedule is None:
+        abort(404, description='No schedule has been loaded yet')
+
+    sessions = ws.day_schedule.get_filtered_sessions(request.args.getlist('selectedTypes'),
+                                                     request.args.getlist('selectedSessFormats'),
+                                                     request.args.getlist('selectedSponsors'),
+                                                     request.args.getlist('selectedTopics'))
+
+    return paginate(sessions, SESSION_SORT_KEYS, lambda sess: sess.session_id, sessionToJson)
+
+
+
+@app.route('/api/facets', methods = ['GET'])
+def apiFacets():
+    """Returns, for every session facet, the number of unscheduled sessions with each value that pass the
+    Step 1 filters on the other facets, so a front end can show live counts next to the filter checkboxes."""
+
+    ws = getWorkspace()
+    if ws.day_schedule is None:
+        abort(404, description='No schedule has been loaded yet')
+
+    counts = ws.day_schedule.get_facet_counts(request.args.getlist('selectedTypes'),
+                                              request.args.getlist('selectedSessFormats'),
+                                              request.args.getlist('selectedSponsors'),
+                                              request.args.getlist('selectedTopics'))
+
+    response = jsonify(counts)
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+
+@app.route('/api/rooms', methods = ['GET'])
+def apiRooms():
+    """Returns a page of the rooms that match the Step 3 filters, with their number of free slots on the
+    selected dates and times. Filters are passed as query arguments with the names of the Step 3 form fields;
+    dates and times default to the ones selected in Step 2."""
+
+    ws = getWorkspace()
+    if ws.day_schedule is None:
+        abort(404, description='No schedule has been loaded yet')
+
+    day_schedule = ws.day_schedule
+
+    try:
+        selectedDates = [parseSlotValue(date) for date in request.args.getlist('selectedDates')] or session.get('selectedDates') or list(range(len(day_schedule.days)))
+        selectedTimes = [parseSlotValue(time) for time in request.args.getlist('selectedTimes')] or session.get('selectedTimes') or list(range(len(day_schedule.start_times)))
+
+        avbleRooms = day_schedule.get_filtered_room_availability(selectedDates, selectedTimes,
+                                                                 request.args.getlist('selectedProperties'),
+                                                                 request.args.getlist('selectedAVSetups'),
+                                                                 request.args.get('maxCapacity', type=int),
+                                                                 request.args.getlist('selectedRoomFormats'),
+                                                                 ws.selected_sessions)
+    except ValueError as err:
+        abort(400, description=str(err))
+
+    return paginate(avbleRooms, ROOM_SORT_KEYS, lambda entry: entry[0].room_id, roomToJson)
+
+
+
+
+def metricsToText(report: dict, jobCounts: dict[str, int]) -> str:
+    """Formats a metrics report and job counts in the Prometheus text exposition format."""
+
+    lines = ['# TYPE scheduler_jobs gauge']
+    lines += [f'scheduler_jobs{{status="{status}"}} {count}' for status, count in jobCounts.items()]
+
+    if report is not None:
+        lines.append('# TYPE scheduler_rejections_total counter')
+        lines += [f'scheduler_rejections_total{{reason="{reason}"}} {count}' for reason, count in report['rejections'].items()]
+        lines.append('# TYPE scheduler_phase_seconds_total counter')
+        lines += [f'scheduler_phase_seconds_total{{phase="{phase}"}} {phase_report["seconds"]:.6f}' for phase, phase_report in report['phases'].items()]
+        lines.append('# TYPE scheduler_phase_calls_total counter')
+        lines += [f'scheduler_phase_calls_total{{phase="{phase}"}} {phase_report["calls"]}' for phase, phase_report in report['phases'].items()]
+        lines.append('# TYPE scheduler_sessions_total counter')
+        lines += [f'scheduler_sessions_total{{outcome="{outcome}"}} {count}' for outcome, count in report['sessions'].items()]
+        lines.append('# TYPE scheduler_days_total counter')
+        lines.append(f'scheduler_days_total {report["days"]}')
+
+    return '\n'.join(lines) + '\n'
+
+
+
+@app.route('/metrics', methods = ['GET'])
+def metrics():
+    """Returns the scheduler metrics of this process in the Prometheus text format, or as JSON with
+    ?format=json. Rejection counts and phase timings are only collected when SCHEDULER_METRICS is set."""
+
+    with jobManager.lock:
+        report = schedulerMetrics.report() if schedulerMetrics is not None else None
+    jobCounts = jobManager.count_by_status()
+
+    if request.args.get('format') == 'json':
+        return jsonify({'enabled': report is not None, 'jobs': jobCounts, 'scheduler': report})
 
-        return render_template('Step4.html', schedule=day_schedule.get_scheduled_sessions()) 
+    return Response(metricsToText(report, jobCounts), mimetype='text/plain; version=0.0.4')
 
 
 
 
 if __name__ == '__main__':
-    import os
     HOST = os.environ.get('SERVER_HOST', 'localhost')
     try:
         PORT = int(os.environ.get('SERVER_PORT', '5555'))
@@ -0,0 +1,380 @@
+"""
+Benchmarks the parser and the scheduler on synthetic conferences.
+Conferences are generated from a seed at multiples of the size of the bundled data, and the results are written as
+JSON so runs can be compared with --compare.
+
+    python benchmark.py --output results.json
+    python benchmark.py --compare results.json
+    python benchmark.py --scales 20 50 --repeat 1 --output large.json
+
+The default scales finish in a few minutes; create_schedule grows faster than linearly with the conference, so
+20x and 50x take much longer.
+"""
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+import argparse
+import copy
+import csv
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import parse
+import schedule
+
+
+# Sizes of the bundled data, which a scale of 1 reproduces
+BASE_SESSIONS = 835
+BASE_ROOMS = 67
+BASE_SPEAKERS = 3344
+BASE_TOPICS = 88
+BASE_SPONSORS = 309
+
+TYPES = ['Forum Sessions', 'Special Sessions', 'Allied Organizations', 'MLA Committees', 'Linked Sessions',
+         'Just-in-Time', 'Plenary Sessions', 'Social Events', 'Special Events', 'Working Groups', 'Posters',
+         'Exhibit Hall Events']
+FORMATS = ['Panel', 'Roundtable', 'Workshop', 'Lecture', 'Reading', 'Poster', 'Business Meeting', 'Reception', 'Forum']
+PROPERTIES = ['WSCC', 'Sheraton', 'Hilton', 'Marriott']
+EQUIPMENT = ['Projector', 'WiFi', 'Microphone']
+
+
+# Settings of a synthetic conference. Sessions, rooms, speakers, topics and sponsors grow with the scale; days and
+# slots do not. Conflict density shrinks the pools of speakers, topics and sponsors that sessions draw from, so
+# higher densities make more sessions compete for the same slots.
+@dataclass
+class Conference:
+    scale: float = 1.0                  # Multiple of the size of the bundled data
+    seed: int = 0                       # Seed of the random generator
+    conflict_density: float = 1.0       # Pool shrink factor for speakers, topics and sponsors (1 is like the bundled data)
+    days: int = 4                       # Number of conference days
+    slots: int = 7                      # Number of 75 minute slots per day
+    sponsor_rate: float = 0.6           # Share of sessions with a sponsor
+    cosponsor_rate: float = 0.1         # Share of sponsored sessions with a cosponsor
+    equipment_rate: float = 0.1         # Share of sessions that need equipment
+
+
+    # Return the number of sessions, rooms, speakers, topics and sponsors of the conference
+    def sizes(self) -> dict[str, int]:
+        pool = self.scale / self.conflict_density
+        return {
+            'sessions': max(1, round(BASE_SESSIONS * self.scale)),
+            'rooms': max(1, round(BASE_ROOMS * self.scale)),
+            'speakers': max(1, round(BASE_SPEAKERS * pool)),
+            'topics': max(1, round(BASE_TOPICS * pool)),
+            'sponsors': max(1, round(BASE_SPONSORS * pool)),
+        }
+
+
+# Write the five input files of a synthetic conference into a directory and return their paths in the order
+# parse.parseInputs takes them
+def generate(conference: Conference, directory: str) -> tuple[str, str, str, str, str]:
+    rng = random.Random(conference.seed)
+    sizes = conference.sizes()
+    paths = [os.path.join(directory, name) for name in ('Date.csv', 'speaker.csv', 'time.csv', 'rooms.csv', 'session.csv')]
+
+    with open(paths[0], 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['Date'])
+        first = datetime(2020, 1, 9)
+        for d in range(conference.days):
+            day = first + timedelta(days=d)
+            writer.writerow([f'{day.month}/{day.day}/{day.year % 100}'])
+
+    with open(paths[2], 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['StartTime', 'EndTime'])
+        for t in range(conference.slots):
+            start = datetime(1, 1, 1, 8, 30) + timedelta(minutes=105 * t)
+            end = start + timedelta(minutes=75)
+            writer.writerow([f'{start.hour}:{start.minute:02d}', f'{end.hour}:{end.minute:02d}'])
+
+    # Room capacities follow the bundled data: most rooms seat 50 to 125 people, a few seat several hundred
+    with open(paths[3], 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['Room ID', 'Property', 'Room Name', 'Capacity', 'Floor'])
+        for r in range(1, sizes['rooms'] + 1):
+            capacity = min(400, max(25, 5 * round(rng.lognormvariate(math.log(85), 0.5) / 5)))
+            writer.writerow([r, rng.choice(PROPERTIES), f'Room {r}', capacity, rng.randint(1, 4)])
+
+    # Topics are Zipf distributed like in the bundled data, where the most common topic has about 9% of sessions
+    topic_weights = list(itertools.accumulate(1 / (k + 1) ** 0.7 for k in range(sizes['topics'])))
+
+    # Most sessions expect 20 to 50 people, with a long tail up to 400
+    speaker_rows = []
+    with open(paths[4], 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['Session ID', 'Title', 'Format', 'Type', 'EstSeating', 'Topic', 'Sponsor', 'Cosponsor', 'Duration', 'Equipment'])
+        for s in range(1, sizes['sessions'] + 1):
+            session_id = 6000 + s
+            capacity = min(400, 5 * round(rng.lognormvariate(math.log(30), 0.7) / 5))
+            sponsor = cosponsor = equipment = ''
+
+            if rng.random() < conference.sponsor_rate:
+                sponsor = f'Sponsor {rng.randrange(sizes["sponsors"])}'
+                if rng.random() < conference.cosponsor_rate:
+                    cosponsor = f'Sponsor {rng.randrange(sizes["sponsors"])}'
+            if rng.random() < conference.equipment_rate:
+                equipment = rng.choice(EQUIPMENT)
+
+            writer.writerow([session_id, f'Session {s}', rng.choice(FORMATS), rng.choice(TYPES), capacity,
+                             f'Topic {bisect_left(topic_weights, rng.random() * topic_weights[-1])}', sponsor, cosponsor, 75, equipment])
+
+            # Like the bundled data, sessions have about six speakers and speakers appear in about 1.5 sessions
+            for speaker_id in rng.sample(range(sizes['speakers']), min(sizes['speakers'], rng.randint(3, 9))):
+                speaker_rows.append((speaker_id, session_id))
+
+    with open(paths[1], 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['Personid', 'First', 'Last', 'SessionID'])
+        for speaker_id, session_id in speaker_rows:
+            writer.writerow([speaker_id, f'Speaker{speaker_id}', chr(ord('A') + speaker_id % 26), session_id])
+
+    return tuple(paths)
+
+
+# Timing and peak memory of one benchmarked stage
+@dataclass
+class Measurement:
+    wall_time: float                                    # Fastest wall time in seconds
+    median_time: float                                  # Median wall time in seconds
+    peak_memory: int                                    # Peak memory allocated during a traced run, in bytes
+    times: list[float] = field(default_factory=list)    # Wall time of every timed run
+
+
+# Time a stage over several runs and measure its peak memory in one more run under tracemalloc, which is kept out
+# of the timed runs because it slows them down. setup() builds the state each run starts from and is not timed.
+def measure(setup, run, repeat: int) -> tuple[Measurement, object]:
+    times = []
+    result = None
+
+    for _ in range(repeat):
+        state = setup()
+        start = time.perf_counter()
+        result = run(state)
+        times.append(time.perf_counter() - start)
+
+    state = setup()
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    run(state)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return Measurement(min(times), statistics.median(times), peak, times), result
+
+
+# The session layout before sessions were made compact: a plain dataclass with an instance dict, its own strings
+# and a list for each of sponsors, equipment and speakers. It is only built to measure the footprint the compact
+# layout is compared against.
+@dataclass
+class DictSession:
+    session_id: int                      # Unique session identifier
+    duration: int                        # Time in minutes that a session lasts
+    est_capacity: int                    # Estimated number of attendees
+    title: str                           # Title of session
+    format: str                          # Format of session
+    topic: str                           # Topic of session
+    type: str                            # Type of the session
+    sponsors: list[str]                  # Sponsors, including co-sponsors
+    equipment: list[str]                 # Equipment needed
+    speaker: list[int]                   # Speaker ID's
+    assigned_room: int = 0               # Room ID that the session is scheduled into
+    start_time: datetime = datetime(1, 1, 1)    # Time of day that session is scheduled to start
+    end_time: datetime = datetime(1, 1, 1)      # Time of day that session is scheduled to end
+
+
+# Parse a sessions file into the dict layout, reading the same columns as parse.iterSessions
+def parse_dict_sessions(filename: str) -> list[DictSession]:
+    sessions = []
+    for row_number, row in parse.readRows(filename, parse.SESSION_COLUMNS, optional=('cosponsor', 'speakers', 'equipment')):
+        sessions.append(DictSession(parse.toInt(row['session_id'], filename, row_number, 'Session ID'),
+                                    parse.toInt(row['duration'], filename, row_number, 'Duration'),
+                                    parse.toInt(row['capacity'], filename, row_number, 'EstSeating'),
+                                    row['title'], row['format'], row['topic'], row['type'],
+                                    [sponsor for sponsor in (row['sponsor'], row.get('cosponsor', '')) if sponsor] or [''],
+                                    parse.toList(row.get('equipment', '')),
+                                    [parse.toInt(speaker, filename, row_number, 'Speaker ID') for speaker in parse.toList(row.get('speakers', '')) if speaker != '']))
+    return sessions
+
+
+# Return the memory held by the sessions parsed from a file, in bytes per session, for the compact layout of
+# parse.parseSession and the dict layout it replaced. Each parse shares tuples through a pool of its own, so the
+# sessions pay for their own.
+def session_footprint(sessions_file: str) -> tuple[float, float]:
+    footprints = []
+    for parse_sessions in (parse.parseSession, parse_dict_sessions):
+        tracemalloc.start()
+        sessions = parse_sessions(sessions_file)
+        held = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        footprints.append(held / len(sessions) if sessions else 0.0)
+        del sessions
+
+    return footprints[0], footprints[1]
+
+
+# Benchmark parsing and scheduling of the conference in the given input files. Returns the measurements of every
+# stage and the placed-session ratio of create_schedule.
+def run_benchmark(paths: tuple[str, str, str, str, str], repeat: int = 3) -> dict:
+    days_file, speakers_file, time_file, rooms_file, sessions_file = paths
+    stages = {}
+    session_bytes, dict_session_bytes = session_footprint(sessions_file)
+
+    for name, function, filename in (('parse.parseDays', parse.parseDays, days_file),
+                                     ('parse.parseTime', parse.parseTime, time_file),
+                                     ('parse.parseRooms', parse.parseRooms, rooms_file),
+                                     ('parse.parseSpeakerIndex', parse.parseSpeakerIndex, speakers_file),
+                                     ('parse.parseSession', parse.parseSession, sessions_file)):
+        stages[name], _ = measure(lambda: filename, function, repeat)
+
+    # parseInputs reads a snapshot once the files have been parsed, so it is measured both ways
+    with tempfile.TemporaryDirectory() as cache_dir:
+        stages['parse.parseInputs (cold)'], _ = measure(lambda: [os.remove(os.path.join(cache_dir, name)) for name in os.listdir(cache_dir)],
+                                                        lambda _: parse.parseInputs(*paths, cache_dir=cache_dir), repeat)
+        stages['parse.parseInputs (snapshot)'], inputs = measure(lambda: None, lambda _: parse.parseInputs(*paths, cache_dir=cache_dir), repeat)
+
+    days, speakers, session_speakers, start_times, end_times, rooms, sessions = inputs
+
+    # Every run works on its own copy, since scheduling changes sessions and rooms
+    def fresh() -> schedule.Schedule:
+        parts = copy.deepcopy((days, speakers, session_speakers, start_times, end_times, rooms, sessions))
+        return schedule.Schedule(parts[3], parts[4], parts[0], parts[6], parts[5], parts[1], session_speakers=parts[2])
+
+    def initialized() -> schedule.Schedule:
+        sched = fresh()
+        sched.init()
+        return sched
+
+    def create(sched: schedule.Schedule) -> schedule.Schedule:
+        sched.create_schedule(list(sched.all_sessions), sched.all_rooms, list(range(len(sched.days))), list(range(len(sched.start_times))))
+        return sched
+
+    def create_global(sched: schedule.Schedule) -> schedule.Schedule:
+        sched.create_global_schedule(list(sched.all_sessions), sched.all_rooms, list(range(len(sched.days))), list(range(len(sched.start_times))))
+        return sched
+
+    stages['Schedule.init'], _ = measure(fresh, lambda sched: sched.init(), repeat)
+    stages['Schedule.create_schedule'], scheduled = measure(initialized, create, repeat)
+    stages['Schedule.create_global_schedule'], scheduled_global = measure(initialized, create_global, repeat)
+
+    # Room availability as Step 3 asks for it when the page is loaded: all filters and the leftover sessions
+    def availability(sched: schedule.Schedule):
+        return sched.get_filtered_room_availability(list(range(len(sched.days))), list(range(len(sched.start_times))),
+                                                    sched.get_room_properties(), sched.get_room_equipment(),
+                                                    sched.get_room_max_capacity(), sched.get_room_formats(),
+                                                    sched.get_unscheduled_sessions())
+
+    stages['Schedule.get_filtered_room_availability'], _ = measure(lambda: scheduled, availability, repeat)
+
+    placed = len(scheduled.sessions_scheduled)
+    return {
+        'sessions': len(sessions),
+        'rooms': len(rooms),
+        'speakers': len(speakers),
+        'days': len(days),
+        'slots': len(start_times),
+        'placed': placed,
+        'placed_ratio': placed / len(sessions) if sessions else 0.0,
+        'global_placed': len(scheduled_global.sessions_scheduled),
+        'utilization': {mode: sched.get_utilization(sched.all_rooms, list(range(len(sched.days))), list(range(len(sched.start_times))))
+                        for mode, sched in (('cascade', scheduled), ('global', scheduled_global))},
+        'session_bytes': session_bytes,
+        'dict_session_bytes': dict_session_bytes,
+        'stages': {name: m.__dict__ for name, m in stages.items()},
+    }
+
+
+# Return the stages whose fastest time grew by more than the tolerance and by at least min_delta seconds, placed
+# ratios that dropped and session footprints that grew by more than the tolerance, between two benchmark reports,
+# as readable lines
+def compare(baseline: dict, current: dict, tolerance: float = 0.1, min_delta: float = 0.001) -> list[str]:
+    regressions = []
+    baseline_runs = {run['name']: run for run in baseline['runs']}
+
+    for run in current['runs']:
+        old = baseline_runs.get(run['name'])
+        if old is None:
+            continue
+
+        if run['placed_ratio'] < old['placed_ratio']:
+            regressions.append(f"{run['name']}: placed ratio {old['placed_ratio']:.3f} -> {run['placed_ratio']:.3f}")
+
+        if 'session_bytes' in old and run['session_bytes'] > old['session_bytes'] * (1 + tolerance):
+            regressions.append(f"{run['name']}: {old['session_bytes']:.0f} -> {run['session_bytes']:.0f} bytes per session")
+
+        for stage, m in run['stages'].items():
+            if stage in old['stages']:
+                before = old['stages'][stage]['wall_time']
+                if m['wall_time'] > before * (1 + tolerance) and m['wall_time'] - before >= min_delta:
+                    regressions.append(f"{run['name']}: {stage} {before * 1000:.1f} ms -> {m['wall_time'] * 1000:.1f} ms")
+
+    return regressions
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', type=float, nargs='+', default=[1, 2, 5, 10], help='multiples of the bundled data size to generate')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic conferences')
+    parser.add_argument('--density', type=float, default=1.0, help='conflict density (1 is like the bundled data)')
+    parser.add_argument('--days', type=int, default=4, help='conference days')
+    parser.add_argument('--slots', type=int, default=7, help='slots per day')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per stage')
+    parser.add_argument('--bundled', action='store_true', help='also benchmark the CSV files in the working directory')
+    parser.add_argument('--output', help='write the JSON report to this file instead of standard output')
+    parser.add_argument('--compare', help='report stages slower than in this earlier JSON report')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='relative slowdown allowed by --compare')
+    parser.add_argument('--min-delta', type=float, default=0.001, help='slowdown in seconds below which --compare ignores a stage')
+    args = parser.parse_args(argv)
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'density': args.density,
+        'repeat': args.repeat,
+        'runs': [],
+    }
+
+    if args.bundled:
+        paths = ('Date.csv', 'speaker.csv', 'time.csv', 'rooms.csv', 'session.csv')
+        report['runs'].append({'name': 'bundled', 'scale': None, **run_benchmark(paths, args.repeat)})
+
+    for scale in args.scales:
+        conference = Conference(scale, args.seed, args.density, args.days, args.slots)
+        with tempfile.TemporaryDirectory() as directory:
+            result = run_benchmark(generate(conference, directory), args.repeat)
+        report['runs'].append({'name': f'{scale:g}x', 'scale': scale, **result})
+        print(f"{scale:g}x: placed {result['placed']} of {result['sessions']} sessions, "
+              f"create_schedule {result['stages']['Schedule.create_schedule']['wall_time']:.3f} s, "
+              f"create_global_schedule placed {result['global_placed']} in {result['stages']['Schedule.create_global_schedule']['wall_time']:.3f} s, "
+              f"{result['session_bytes']:.0f} bytes per session ({result['dict_session_bytes']:.0f} with the dict layout)", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(json.load(file), report, args.tolerance, args.min_delta)
+        for line in regressions:
+            print(f'regression: {line}', file=sys.stderr)
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,182 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+import copy
+import threading
+import time
+import uuid
+
+import schedule
+import workspace
+
+
+# Raised inside a running job once it has been cancelled, to stop the scheduler where it is
+class JobCancelled(Exception):
+    pass
+
+
+# A job runs one solver backend for a workspace in the background. It works on a copy of the workspace's
+# schedule, so a cancelled or failed job leaves the workspace as it was.
+@dataclass
+class Job:
+    job_id: str                             # Random ID used to poll, cancel and fetch the job
+    workspace_id: str                       # ID of the workspace the job schedules
+    backend: str                            # Name of the solver backend
+    total: int                              # Number of sessions given to the job
+    status: str = 'queued'                  # 'queued', 'running', 'done', 'cancelled' or 'failed'
+    placed: int = 0                         # Number of sessions placed so far
+    current_day: str = None                 # Day being scheduled, or None outside a day
+    result: object = None                   # Solver report once the job is done
+    error: str = None                       # Reason the job failed
+    started: float = 0.0                    # Time the job started running
+    finished: float = 0.0                   # Time the job stopped running
+    metrics: dict = None                    # Report of the scheduler metrics of the run, if metrics are enabled
+    cancel_event: threading.Event = field(default_factory=threading.Event)  # Set to ask the job to stop
+
+
+    # Ask the job to stop. A queued job never starts; a running job stops at its next progress report.
+    def cancel(self):
+        self.cancel_event.set()
+        if self.status == 'queued':
+            self.status = 'cancelled'
+
+
+    # Return whether the job has stopped running
+    def is_finished(self) -> bool:
+        return self.status in ('done', 'cancelled', 'failed')
+
+
+    # Return the job's state in the form served by the progress endpoint
+    def to_json(self) -> dict:
+        result = None
+        if self.result is not None:
+            result = {'backend': self.result.backend, 'placed': self.result.placed, 'total': self.result.total,
+                      'wallTime': self.result.wall_time, 'gap': self.result.gap, 'status': self.result.status,
+                      'utilization': self.result.utilization, 'repairRate': self.result.repair_rate}
+
+        elapsed = 0.0
+        if self.started:
+            elapsed = (self.finished or time.perf_counter()) - self.started
+
+        return {'id': self.job_id, 'status': self.status, 'backend': self.backend, 'placed': self.placed,
+                'total': self.total, 'currentDay': self.current_day, 'elapsed': elapsed, 'error': self.error,
+                'result': result, 'metrics': self.metrics}
+
+
+# The job manager runs scheduling jobs in a thread pool and keeps the most recent ones so their results can be
+# fetched. Jobs only live in the process that started them and are not stored in the workspace database, so
+# several worker processes need sticky sessions for status and cancel requests to find their job. Given metrics,
+# every job collects scheduler metrics and adds them to these once it has finished.
+class JobManager:
+    def __init__(self, store: workspace.WorkspaceStore, workers: int = 2, capacity: int = 64, metrics: schedule.Metrics = None):
+        self.store = store
+        self.capacity = capacity
+        self.metrics = metrics
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='schedule-job')
+
+
+    # Start scheduling the workspace's selected sessions into its selected rooms on the given days and slots.
+    # Returns the queued job.
+    def submit(self, workspace_id: str, backend: str, days: list[int], times: list[int], time_limit: float) -> Job:
+        ws = self.store.get(workspace_id)
+        total = sum(ws.day_schedule.is_unscheduled(sess.session_id) for sess in ws.selected_sessions)
+        job = Job(uuid.uuid4().hex, workspace_id, backend, total)
+
+        with self.lock:
+            self.jobs[job.job_id] = job
+            while len(self.jobs) > self.capacity:
+                oldest = next((id for id, other in self.jobs.items() if other.is_finished()), None)
+                if oldest is None:
+                    break
+                del self.jobs[oldest]
+
+        self.pool.submit(self.run, job, days, times, time_limit)
+        return job
+
+
+    # Return the job with the given ID if it belongs to the workspace, otherwise None
+    def get(self, job_id: str, workspace_id: str) -> Job:
+        with self.lock:
+            job = self.jobs.get(job_id)
+
+        if job is None or job.workspace_id != workspace_id:
+            return None
+        return job
+
+
+    # Return the number of known jobs in each status
+    def count_by_status(self) -> dict[str, int]:
+        with self.lock:
+            counts = dict.fromkeys(('queued', 'running', 'done', 'cancelled', 'failed'), 0)
+            for job in self.jobs.values():
+                counts[job.status] += 1
+        return counts
+
+
+    # Return the most recent job of the workspace that has not finished yet, or None
+    def get_running(self, workspace_id: str) -> Job:
+        with self.lock:
+            for job in reversed(self.jobs.values()):
+                if job.workspace_id == workspace_id and not job.is_finished():
+                    return job
+        return None
+
+
+    # Run a job on a copy of its workspace and put the scheduled copy back into the workspace when it is done,
+    # unless the planner changed the workspace in the meantime
+    def run(self, job: Job, days: list[int], times: list[int], time_limit: float):
+        if job.cancel_event.is_set():
+            return
+
+        job.status = 'running'
+        job.started = time.perf_counter()
+
+        try:
+            ws = self.store.get(job.workspace_id)
+            version = ws.version
+            # Copying the schedule and the selections together keeps the selections pointing into the copied schedule
+            day_schedule, sessions, rooms = copy.deepcopy((ws.day_schedule, ws.selected_sessions, ws.selected_rooms))
+            placed_before = len(day_schedule.sessions_scheduled)
+
+            def progress(day_index: int):
+                if job.cancel_event.is_set():
+                    raise JobCancelled()
+                job.placed = len(day_schedule.sessions_scheduled) - placed_before
+                job.current_day = str(day_schedule.days[day_index].date()) if day_index >= 0 else None
+
+            day_schedule.progress = progress
+            if self.metrics is not None:
+                day_schedule.metrics = schedule.Metrics()
+
+            result = day_schedule.solve(sessions, rooms, days, times, job.backend, time_limit)
+            day_schedule.progress = None
+
+            if self.metrics is not None:
+                job.metrics = day_schedule.metrics.report()
+                with self.lock:
+                    self.metrics.merge(day_schedule.metrics)
+                day_schedule.metrics = None
+
+            if job.cancel_event.is_set():
+                raise JobCancelled()
+
+            ws = self.store.get(job.workspace_id)
+            if ws.version != version:
+                raise RuntimeError('The workspace changed while the schedule was generated')
+
+            ws.day_schedule, ws.selected_sessions, ws.selected_rooms = day_schedule, sessions, rooms
+            self.store.save(job.workspace_id, ws)
+
+            job.result = result
+            job.placed = result.placed
+            job.current_day = None
+            job.status = 'done'
+        except JobCancelled:
+            job.status = 'cancelled'
+        except Exception as err:
+            job.error = str(err)
+            job.status = 'failed'
+        finally:
+            job.finished = time.perf_counter()
@@ -1,164 +1,452 @@
 import csv
+import io
 from dataclasses import dataclass, field
+import hashlib
 import math
+import os
+import pickle
 from datetime import datetime
 import schedule
 
-def generatedCSV(sessions):
 
-	fields = ['Session ID','Title', 'Format', 'Type', 'Estimated Capacity',
-	'Subject/Topic', 'Sponsor','Start Time', 'End Time' ,'Room ID', 'Date'] 
-
-	rows = []
-	
-	for session in sessions:
-		
-		temp_id = session.session_id
-		temp_title = session.title
-		temp_format = session.format
-		temp_type = session.type
-		temp_capacity = session.est_capacity
-		temp_topic= session.topic
-		temp_sponsor = session.sponsors
-		temp_start= session.start_time.time()
-		temp_end = session.end_time.time()
-		temp_room = session.assigned_room
-		hold = session.start_time.month
-		hold1 = session.start_time.day
-		temp_day = str(hold) + "/" + str(hold1)
-
-		row = [temp_id, temp_title, temp_format, temp_type,
-		temp_capacity, temp_topic, temp_sponsor, temp_start, temp_end, temp_room, temp_day]
-		
-		rows.append(row)
-
-	with open('SCHEDULEOUTPUT.csv', 'w', encoding='utf8') as f:
-		write = csv.writer(f)
-		write.writerow(fields)
-		write.writerows(rows)
+EXPORT_FIELDS = ['Session ID', 'Title', 'Format', 'Type', 'Estimated Capacity',
+                 'Subject/Topic', 'Sponsor', 'Start Time', 'End Time', 'Room ID', 'Date']
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrow'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+# Number of rows written per chunk of a streamed export
+EXPORT_CHUNK_ROWS = 1000
+
+
+# Yield one export row per scheduled session. Sponsors are kept as a list so each format can write them as
+# real values; sessions without a sponsor get an empty list.
+def exportRows(sessions):
+    for session in sessions:
+        yield [session.session_id, session.title, session.format, session.type, session.est_capacity,
+               session.topic, [sponsor for sponsor in session.sponsors if sponsor != ''],
+               session.start_time.time(), session.end_time.time(), session.assigned_room,
+               f"{session.start_time.month}/{session.start_time.day}"]
+
+
+# Yield the schedule as CSV text, a chunk of rows at a time. Sponsor names can contain commas, so sponsors are
+# joined with semicolons.
+def iterCSV(sessions, chunk_rows=EXPORT_CHUNK_ROWS):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+
+    for i, row in enumerate(exportRows(sessions), 1):
+        row[6] = '; '.join(row[6])
+        writer.writerow(row)
+
+        if i % chunk_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
+
+
+# A write-only file that hands out what has been written since the last call to take(). Columnar writers
+# stream into it so their output can be sent on as it is produced.
+class ChunkSink:
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+# Return a generator of the schedule as an Arrow IPC stream or a Parquet file, one record batch (or row group)
+# of rows at a time. Sponsors are written as a list of strings. Requires pyarrow.
+def iterColumnar(sessions, format, chunk_rows=EXPORT_CHUNK_ROWS):
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError(f"Exporting to {format} requires pyarrow (pip install pyarrow)")
+
+    columns = [
+        ('Session ID', pyarrow.int64()), ('Title', pyarrow.string()), ('Format', pyarrow.string()),
+        ('Type', pyarrow.string()), ('Estimated Capacity', pyarrow.int64()), ('Subject/Topic', pyarrow.string()),
+        ('Sponsor', pyarrow.list_(pyarrow.string())), ('Start Time', pyarrow.time32('s')),
+        ('End Time', pyarrow.time32('s')), ('Room ID', pyarrow.int64()), ('Date', pyarrow.string()),
+    ]
+    arrow_schema = pyarrow.schema(columns)
 
+    sink = ChunkSink()
+    if format == 'parquet':
+        writer = pyarrow.parquet.ParquetWriter(sink, arrow_schema)
+    else:
+        writer = pyarrow.ipc.new_stream(sink, arrow_schema)
+
+    def batch(rows):
+        return pyarrow.RecordBatch.from_arrays([pyarrow.array(values, type=column[1]) for values, column in zip(zip(*rows), columns)], schema=arrow_schema)
+
+    def chunks():
+        rows = []
+        for row in exportRows(sessions):
+            rows.append(row)
+
+            if len(rows) == chunk_rows:
+                writer.write_batch(batch(rows))
+                rows = []
+                yield sink.take()
+
+        if rows:
+            writer.write_batch(batch(rows))
+        writer.close()
+        yield sink.take()
+
+    # pyarrow is imported before the first chunk is asked for, so a missing install is reported up front
+    return chunks()
+
+
+# Yield the schedule of the given scheduled sessions in one of EXPORT_FORMATS, chunk by chunk
+def iterExport(sessions, format='csv', chunk_rows=EXPORT_CHUNK_ROWS):
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{format}', expected one of {', '.join(EXPORT_FORMATS)}")
+
+    if format == 'csv':
+        return iterCSV(sessions, chunk_rows)
+    return iterColumnar(sessions, format, chunk_rows)
+
+
+# Write the schedule of the given scheduled sessions to SCHEDULEOUTPUT.csv
+def generatedCSV(sessions):
+    with open('SCHEDULEOUTPUT.csv', 'w', encoding='utf8', newline='') as f:
+        for chunk in iterCSV(sessions):
+            f.write(chunk)
+
+
+
+# Raised when an input file is missing a column or a row holds a value of the wrong type
+class ParseError(ValueError):
+    def __init__(self, filename, row_number, message):
+        self.filename = filename
+        self.row_number = row_number
+        if row_number is None:
+            super().__init__(f"{filename}: {message}")
+        else:
+            super().__init__(f"{filename}, row {row_number}: {message}")
+
+
+# Normalize a header name so that 'Room ID', 'room_id' and 'RoomID' all match
+def normalizeColumn(name):
+    return name.strip().lower().replace(' ', '').replace('_', '')
+
+
+# Yield (row number, {column: value}) for every row of a CSV file, one row at a time. Columns are mapped by
+# header name: each key of columns lists the header names accepted for it, and keys in optional may be missing.
+# Files may start with a UTF-8 byte order mark.
+def readRows(filename, columns, optional=()):
+    with open(filename, encoding="utf-8-sig", newline="") as file:
+        csvreader = csv.reader(file)
+        header = next(csvreader, None)
+
+        if header is None:
+            raise ParseError(filename, None, "file is empty")
+
+        positions = {normalizeColumn(name): i for i, name in enumerate(header)}
+        mapping = {}
+
+        for key, names in columns.items():
+            for name in names:
+                if normalizeColumn(name) in positions:
+                    mapping[key] = positions[normalizeColumn(name)]
+                    break
+            else:
+                if key not in optional:
+                    raise ParseError(filename, 1, f"missing column '{names[0]}'")
+
+        for row in csvreader:
+            if not any(value.strip() for value in row):
+                continue
+            yield csvreader.line_num, {key: row[i].strip() if i < len(row) else "" for key, i in mapping.items()}
+
+
+# Convert a field to an integer or raise a ParseError naming the row and column
+def toInt(value, filename, row_number, column):
+    try:
+        return int(value)
+    except ValueError:
+        raise ParseError(filename, row_number, f"column '{column}' expected an integer, got '{value}'") from None
+
+
+# Convert a field such as 8:30 to a datetime on 1/1/1
+def toTime(value, filename, row_number, column):
+    try:
+        hour, minute = value.split(':')
+        return datetime(1, 1, 1, int(hour), int(minute))
+    except ValueError:
+        raise ParseError(filename, row_number, f"column '{column}' expected a time like 8:30, got '{value}'") from None
+
+
+# Convert a field such as 1/9/20 to a datetime
+def toDate(value, filename, row_number, column):
+    try:
+        month, day, year = value.split('/')
+        return datetime(int(year), int(month), int(day))
+    except ValueError:
+        raise ParseError(filename, row_number, f"column '{column}' expected a date like 1/9/20, got '{value}'") from None
+
+
+# Split a comma separated field into a list, using [''] for an empty field like the scheduler expects
+def toList(value):
+    items = [item.strip() for item in value.split(',') if item.strip() != '']
+    return items if items else ['']
+
+
+ROOM_COLUMNS = {
+    'room_id': ('Room ID',),
+    'property': ('Property',),
+    'name': ('Room Name',),
+    'capacity': ('Capacity', 'Capacity of the Room'),
+    'floor': ('Floor',),
+    'format': ('Room Format', 'Format'),
+}
+
+SESSION_COLUMNS = {
+    'session_id': ('Session ID',),
+    'title': ('Title', 'Session Title'),
+    'format': ('Format',),
+    'type': ('Type',),
+    'capacity': ('EstSeating', 'Estimated Seating', 'Estimated Capacity'),
+    'topic': ('Topic',),
+    'sponsor': ('Sponsor',),
+    'cosponsor': ('Cosponsor',),
+    'duration': ('Duration',),
+    'speakers': ('Speaker ID', 'Speakers', 'Speaker'),
+    'equipment': ('Equipment', 'Equipment Request'),
+}
+
+SPEAKER_COLUMNS = {
+    'speaker_id': ('Personid', 'Person ID', 'Speaker ID'),
+    'first_name': ('First', 'First Name'),
+    'last_initial': ('Last', 'Last Initial'),
+    'session_id': ('SessionID', 'Session ID'),
+}
+
+TIME_COLUMNS = {
+    'start': ('StartTime', 'Start Time', 'Start Times'),
+    'end': ('EndTime', 'End Time', 'End Times'),
+}
+
+DATE_COLUMNS = {
+    'date': ('Date', 'Dates'),
+}
+
+
+def iterRooms(filename):
+    for row_number, row in readRows(filename, ROOM_COLUMNS, optional=('format',)):
+        temp_room_id = toInt(row['room_id'], filename, row_number, 'Room ID')
+        temp_capacity = toInt(row['capacity'], filename, row_number, 'Capacity')
+        temp_floor = toInt(row['floor'], filename, row_number, 'Floor')
+
+        yield schedule.Room(temp_room_id, temp_capacity, row['name'], row['property'], temp_floor, row.get('format', ''))
 
 
 def parseRooms(filename):
-    file = open(filename, encoding="utf8")
-    csvreader = csv.reader(file)
-    header = next(csvreader)
-    rows = []
+    return list(iterRooms(filename))
 
-    RoomList = []
 
-    for row in csvreader:
-        #rows.append(row)
-        temp_room_id = int(row[0])
-        temp_property = row[1]
-        temp_room_name = row[2]
-        temp_capacity = int(row[3])
-        temp_floor = int(row[4])
+def iterTime(filename):
+    for row_number, row in readRows(filename, TIME_COLUMNS):
+        start = toTime(row['start'], filename, row_number, 'StartTime')
+        end = toTime(row['end'], filename, row_number, 'EndTime')
 
-        tempRoom = schedule.Room(temp_room_id, temp_capacity, temp_room_name, temp_property, temp_floor)
+        if end <= start:
+            raise ParseError(filename, row_number, f"slot ends at {row['end']}, before it starts at {row['start']}")
 
-        RoomList.append(tempRoom)
+        yield start, end
 
-    file.close()
-    return RoomList
 
 def parseTime(filename):
-    file = open(filename, encoding="utf8")
-    csvreader = csv.reader(file)
-    header = next(csvreader)
-    rows = []
     start_time_list = []
     end_time_list = []
 
+    for start, end in iterTime(filename):
+        start_time_list.append(start)
+        end_time_list.append(end)
 
-    for row in csvreader:
+    return start_time_list, end_time_list
 
-        time = row[0].split(':')
-        hour = int(time[0])
-        minute = int(time[1])
-        time_2 = row[1].split(':')
-        hour2 = int(time_2[0])
-        minute2 = int(time_2[1])
-        start_time_list.append(datetime(1,1,1,hour,minute))
-        end_time_list.append(datetime(1,1,1,hour2,minute2))
 
-    return start_time_list, end_time_list
+def iterDays(filename):
+    for row_number, row in readRows(filename, DATE_COLUMNS):
+        yield toDate(row['date'], filename, row_number, 'Date')
+
 
 def parseDays(filename):
-    file = open(filename, encoding="utf8")
-    csvreader = csv.reader(file)
-    header = next(csvreader)
-    rows = []
+    return list(iterDays(filename))
 
-    day_list = []
 
-    for row in csvreader:
+# Yield (speaker ID, first name, last initial, session ID) for every row of the speaker file
+def iterSpeakerRows(filename):
+    for row_number, row in readRows(filename, SPEAKER_COLUMNS):
+        temp_id = toInt(row['speaker_id'], filename, row_number, 'Personid')
+        temp_session_id = toInt(row['session_id'], filename, row_number, 'SessionID')
 
-        days =  row[0].split('/')
-        temp_month = int(days[0])
-        temp_day = int(days[1])
-        temp_year = int(days[2])
-        day_list.append(datetime(temp_year,temp_month,temp_day))
+        yield temp_id, row['first_name'], row['last_initial'], temp_session_id
 
-    return day_list
+
+def parseSpeakerIndex(filename):
+    speaker_index = {}
+    session_speakers = {}
+
+    for temp_id, temp_fname, temp_initial, temp_session_id in iterSpeakerRows(filename):
+        temp_speaker = speaker_index.get(temp_id)
+        if temp_speaker is None:
+            temp_speaker = schedule.Speaker(temp_id, temp_fname, temp_initial, [])
+            speaker_index[temp_id] = temp_speaker
+
+        temp_speaker.session_ids.append(temp_session_id)
+        session_speakers.setdefault(temp_session_id, []).append(temp_id)
+
+    return list(speaker_index.values()), session_speakers
 
 
 def parseSpeakers(filename):
-    file = open(filename, encoding="utf8")
-    csvreader = csv.reader(file)
-    header = next(csvreader)
-    rows = []
-    speaker_list = []
-
-    count = 0 
-
-    for row in csvreader:
-        temp_id = int(row[0])
-        flag = False
-
-        if count > 0:
-            for speakers in speaker_list:
-                if speakers.speaker_id == temp_id:
-                    test = int(row[3])
-                    speakers.session_ids.append(test)
-                    flag = True
-                
-        if flag == False:
-        
-            temp_fname = row[1]
-            temp_initial = row[2]
-            temp_session_id = [int(row[3])]
-            temp_speaker = schedule.Speaker(temp_id, temp_fname, temp_initial, temp_session_id)
-            speaker_list.append(temp_speaker)
-
-        count += 1
+    speaker_list, session_speakers = parseSpeakerIndex(filename)
     return speaker_list
 
 
+# Sessions list the sponsor followed by the cosponsor. Sponsor names can contain commas, so each column is one
+# sponsor and is never split. Speakers and equipment are optional columns; sessions without speakers take theirs
+# from the speaker file when the schedule is initialized. The sessions of one file share their sponsor, equipment
+# and speaker tuples through a pool that lasts as long as the parse.
+def iterSessions(filename):
+    pool = {}
+    for row_number, row in readRows(filename, SESSION_COLUMNS, optional=('cosponsor', 'speakers', 'equipment')):
+        temp_session_id = toInt(row['session_id'], filename, row_number, 'Session ID')
+        temp_estimated_capacity = toInt(row['capacity'], filename, row_number, 'EstSeating')
+        temp_duration = toInt(row['duration'], filename, row_number, 'Duration')
+        temp_sponsor = [sponsor for sponsor in (row['sponsor'], row.get('cosponsor', '')) if sponsor] or ['']
+        temp_equipment = toList(row.get('equipment', ''))
+        temp_speaker = [toInt(speaker, filename, row_number, 'Speaker ID') for speaker in toList(row.get('speakers', '')) if speaker != '']
+
+        yield schedule.Session(temp_session_id, temp_duration, temp_estimated_capacity, row['title'], row['format'],
+                               row['topic'], row['type'], temp_sponsor, temp_equipment, temp_speaker, pool=pool)
+
+
 def parseSession(filename):
-    file = open(filename, encoding="utf8")
-    csvreader = csv.reader(file)
-    header = next(csvreader)
-    rows = []
-    SessionList = []
-
-    for row in csvreader:
-    
-        temp_session_id = int(row[0])
-        temp_title = row[1]
-        temp_format = row[2]
-        temp_type = row[3]
-        temp_estimated_capacity = int(row[4])
-        temp_topic = row[5]
-        temp_sponsor = [row[6]]
-        temp_duration = int(row[8])
-        temp_equipment = row[9].split(',')
-        temp_speaker = row[10].split(',')
-        tempSession = schedule.Session(temp_session_id, temp_duration, temp_estimated_capacity,
-        temp_title, temp_format, temp_topic, temp_type, temp_sponsor, temp_equipment, temp_speaker)
-        SessionList.append(tempSession)
-
-
-    file.close()
-    return SessionList
+    return list(iterSessions(filename))
+
+
+# Parsed inputs are cached on disk as pickles named by a hash of the five input files, so resubmitting the same
+# files skips parsing. Bump SNAPSHOT_VERSION whenever the parsed model changes shape.
+SNAPSHOT_VERSION = 4
+SNAPSHOT_DIR = os.environ.get('PARSE_CACHE_DIR', '.parse_cache')
+SNAPSHOT_MAX_BYTES = int(os.environ.get('PARSE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+
+# Hash the contents of the given files in order
+def hashFiles(filenames):
+    digest = hashlib.sha256(f"snapshot-v{SNAPSHOT_VERSION}".encode())
+
+    for filename in filenames:
+        digest.update(b"\0")
+        with open(filename, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 16), b""):
+                digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+# Load a cached snapshot, or return None if there is none or it cannot be read
+def loadSnapshot(key, cache_dir=SNAPSHOT_DIR):
+    path = os.path.join(cache_dir, key + '.pickle')
+
+    try:
+        with open(path, 'rb') as file:
+            snapshot = pickle.load(file)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        return None
+
+    # Mark the snapshot as recently used for eviction
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+    return snapshot
+
+
+# Write a snapshot atomically, then evict old snapshots until the cache fits its size limit
+def saveSnapshot(key, snapshot, cache_dir=SNAPSHOT_DIR, max_bytes=SNAPSHOT_MAX_BYTES):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, key + '.pickle')
+    temp_path = f"{path}.{os.getpid()}.tmp"
+
+    with open(temp_path, 'wb') as file:
+        pickle.dump(snapshot, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, path)
+
+    evictSnapshots(cache_dir, max_bytes)
+
+
+# Remove the least recently used snapshots until the cache is no larger than max_bytes
+def evictSnapshots(cache_dir=SNAPSHOT_DIR, max_bytes=SNAPSHOT_MAX_BYTES):
+    entries = []
+
+    for name in os.listdir(cache_dir):
+        if name.endswith('.pickle'):
+            stat = os.stat(os.path.join(cache_dir, name))
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+    entries.sort()
+    total = sum(size for mtime, size, name in entries)
+
+    while entries and total > max_bytes:
+        mtime, size, name = entries.pop(0)
+        try:
+            os.remove(os.path.join(cache_dir, name))
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+# Parse all five input files, reusing the cached result when the files have not changed. Returns days, speakers,
+# the session to speakers mapping, start times, end times, rooms and sessions.
+def parseInputs(days_file, speakers_file, time_file, rooms_file, sessions_file, cache_dir=SNAPSHOT_DIR):
+    key = hashFiles([days_file, speakers_file, time_file, rooms_file, sessions_file])
+
+    snapshot = loadSnapshot(key, cache_dir)
+    if snapshot is not None:
+        return snapshot
+
+    days = parseDays(days_file)
+    speakers, session_speakers = parseSpeakerIndex(speakers_file)
+    start_times, end_times = parseTime(time_file)
+    rooms = parseRooms(rooms_file)
+    sessions = parseSession(sessions_file)
+    snapshot = (days, speakers, session_speakers, start_times, end_times, rooms, sessions)
+
+    try:
+        saveSnapshot(key, snapshot, cache_dir)
+    except OSError:
+        pass
 
+    return snapshot
@@ -1,11 +1,28 @@
-from dataclasses import dataclass, field
-from datetime import datetime
+from array import array
+from bisect import bisect_left
+from dataclasses import dataclass, field, InitVar
+from datetime import date, datetime, time
 from operator import attrgetter
 import sys
+from time import perf_counter
+from typing import Callable
+
+
+# The start and end time of a session that is not scheduled
+NOT_SCHEDULED = datetime(1, 1, 1)
+
+
+# Return the instance of a value shared through the pool, making it the shared instance if it is new. Pools belong
+# to a single parse or schedule and go away with it; without a pool the value itself is returned. Values are keyed
+# with their type so that equal values of different types (like 1 and 1.0) stay apart.
+def share(pool: dict, value):
+    if pool is None:
+        return value
+    return pool.setdefault((type(value), value), value)
 
 
 # A speaker is someone who will be assigned to one or more sessions to present.
-@dataclass
+@dataclass(slots=True)
 class Speaker:
     speaker_id: int                 # Unique speaker identifer
     first_name: str                 # First name of speaker
@@ -15,8 +32,10 @@ class Speaker:
 
 # A session represents a meeting or event to be scheduled. Each session should have pre-determined 
 # attributes that cannot be left empty because rooms require session attributes to schedule sessions 
-# without breaking constraints.
-@dataclass
+# without breaking constraints. Sessions are kept compact: they have no instance dict, their repeated strings are
+# interned, their lists are stored as tuples shared through the pool they are created with and the times of
+# placed sessions are shared by the sessions of one schedule.
+@dataclass(slots=True)
 class Session:
     session_id: int                      # Unique session identifier
     duration: int                        # Time in minutes that a session lasts
@@ -25,18 +44,35 @@ class Session:
     format: str                          # Format of session (e.g., roundtable)
     topic: str                           # Topic of session (e.g., "African History")
     type: str                            # Type of the session (e.g., Social Event)
-    sponsors: list[str]                  # List of sponsors, including co-sponsors
-    equipment: list[str]                 # List of equipment needed (e.g., WiFi)
-    speaker: list[int]                   # List of speaker ID's
+    sponsors: tuple[str, ...]            # Sponsors, including co-sponsors
+    equipment: tuple[str, ...]           # Equipment needed (e.g., WiFi)
+    speaker: tuple[int, ...]             # Speaker ID's
     assigned_room: int = 0               # Room ID that the session is scheduled into
-    start_time: datetime = datetime(1, 1, 1)    # Time of day that session is scheduled to start
-    end_time: datetime = datetime(1, 1, 1)      # Time of day that session is scheduled to end
+    start_time: datetime = NOT_SCHEDULED        # Time of day that session is scheduled to start
+    end_time: datetime = NOT_SCHEDULED          # Time of day that session is scheduled to end
+    pool: InitVar[dict] = None           # Pool to share tuples and speaker ID's through, usually one per parse
 
 
-    # Set session start and end time
-    def set_time(self, start: datetime, end: datetime, day: datetime):
-        self.start_time = datetime(day.year, day.month, day.day, start.hour, start.minute)
-        self.end_time = datetime(day.year, day.month, day.day, end.hour, end.minute)
+    # Compact the session as it is created
+    def __post_init__(self, pool: dict):
+        self.compact(pool)
+
+
+    # Intern the session's repeated strings and store its sponsors, equipment and speakers as tuples, shared
+    # through the pool if one is given. Called again after the session's attributes are changed.
+    def compact(self, pool: dict = None):
+        self.format = sys.intern(self.format)
+        self.topic = sys.intern(self.topic)
+        self.type = sys.intern(self.type)
+        self.sponsors = share(pool, tuple(sys.intern(sponsor) for sponsor in self.sponsors))
+        self.equipment = share(pool, tuple(sys.intern(item) for item in self.equipment))
+        self.speaker = share(pool, tuple(share(pool, speaker_id) for speaker_id in self.speaker))
+
+
+    # Set session start and end time, sharing the times through the pool if one is given
+    def set_time(self, start: datetime, end: datetime, day: datetime, pool: dict = None):
+        self.start_time = share(pool, datetime(day.year, day.month, day.day, start.hour, start.minute))
+        self.end_time = share(pool, datetime(day.year, day.month, day.day, end.hour, end.minute))
 
     
     # Set scheduled room ID
@@ -44,11 +80,427 @@ class Session:
         self.assigned_room = room_id
 
 
+# Metrics count why placements were rejected and how long each phase of scheduling took. Rejections for capacity,
+# equipment and rooms with no free selected slot ('occupied') are counted once per room tried; duration,
+# 'occupied', speaker, topic and sponsor rejections of single slots once per slot. A schedule only collects
+# metrics while its metrics field is set, so with metrics disabled the hot paths pay a None check.
+@dataclass
+class Metrics:
+    rejections: dict[str, int] = field(default_factory=dict)      # Number of rejections by reason
+    phase_seconds: dict[str, float] = field(default_factory=dict) # Seconds spent in each phase
+    phase_calls: dict[str, int] = field(default_factory=dict)     # Number of times each phase ran
+    sessions_tried: int = 0                                       # Sessions offered to a day
+    sessions_placed: int = 0                                      # Sessions placed on the day they were offered to
+    days_scheduled: int = 0                                       # Number of day schedules created
+
+    REASONS = ('capacity', 'equipment', 'duration', 'speaker', 'topic', 'sponsor', 'occupied')
+
+
+    # Count rejections for a reason
+    def reject(self, reason: str, count: int = 1):
+        self.rejections[reason] = self.rejections.get(reason, 0) + count
+
+
+    # Add time spent in a phase over some number of runs of it
+    def add_time(self, phase: str, seconds: float, calls: int = 1):
+        self.phase_seconds[phase] = self.phase_seconds.get(phase, 0.0) + seconds
+        self.phase_calls[phase] = self.phase_calls.get(phase, 0) + calls
+
+
+    # Add the counts and timings of other metrics to these
+    def merge(self, other: 'Metrics'):
+        for reason, count in other.rejections.items():
+            self.reject(reason, count)
+        for phase, seconds in other.phase_seconds.items():
+            self.add_time(phase, seconds, other.phase_calls.get(phase, 0))
+        self.sessions_tried += other.sessions_tried
+        self.sessions_placed += other.sessions_placed
+        self.days_scheduled += other.days_scheduled
+
+
+    # Return the metrics as a dict of plain values, with every rejection reason present
+    def report(self) -> dict:
+        return {
+            'rejections': {reason: self.rejections.get(reason, 0) for reason in self.REASONS},
+            'phases': {phase: {'seconds': seconds, 'calls': self.phase_calls.get(phase, 0)} for phase, seconds in self.phase_seconds.items()},
+            'sessions': {'tried': self.sessions_tried, 'placed': self.sessions_placed, 'unplaced': self.sessions_tried - self.sessions_placed},
+            'days': self.days_scheduled,
+        }
+
+
+# A conflict log records the speakers, topics and sponsors already booked in each time slot of each day.
+# Every speaker, topic and sponsor is interned to an integer ID and each (day, slot) keeps one bitset per
+# kind, so checking a session against a slot is a bitwise AND instead of building sets from lists.
+@dataclass
+class ConflictLog:
+    num_slots: int = 0                                                         # Number of slots in a day
+    speaker_ids: dict[str, int] = field(default_factory=dict)                  # Maps speakers to bit positions
+    topic_ids: dict[str, int] = field(default_factory=dict)                    # Maps topics to bit positions
+    sponsor_ids: dict[str, int] = field(default_factory=dict)                  # Maps sponsors to bit positions
+    speaker_bits: list[list[int]] = field(default_factory=list)                # Bitset of speakers in each time slot for each day
+    topic_bits: list[list[int]] = field(default_factory=list)                  # Bitset of topics in each time slot for each day
+    sponsor_bits: list[list[int]] = field(default_factory=list)                # Bitset of sponsors and cosponsors in each time slot for each day
+    session_masks: dict[int, tuple[int, int, int]] = field(default_factory=dict)   # Cached speaker, topic and sponsor bitsets of each session
+
+
+    # Create a blank log for one more day
+    def day_init(self):
+        self.speaker_bits.append([0] * self.num_slots)
+        self.topic_bits.append([0] * self.num_slots)
+        self.sponsor_bits.append([0] * self.num_slots)
+
+
+    # Return the bitset of the given values, assigning new bit positions to values seen for the first time
+    def intern(self, ids: dict[str, int], values: list[str]) -> int:
+        mask = 0
+
+        for value in values:
+            if value not in ids:
+                ids[value] = len(ids)
+            mask |= 1 << ids[value]
+
+        return mask
+
+
+    # Return the speaker, topic and sponsor bitsets of a session
+    def get_masks(self, session: Session) -> tuple[int, int, int]:
+        masks = self.session_masks.get(session.session_id)
+
+        if masks is None:
+            speaker_mask = self.intern(self.speaker_ids, session.speaker)
+            topic_mask = self.intern(self.topic_ids, [session.topic])
+            sponsor_mask = self.intern(self.sponsor_ids, session.sponsors) if session.sponsors != ('',) else 0
+            masks = (speaker_mask, topic_mask, sponsor_mask)
+            self.session_masks[session.session_id] = masks
+
+        return masks
+
+
+    # Drop the cached bitsets of a session whose speakers, topic or sponsors have changed
+    def forget(self, session_id: int):
+        self.session_masks.pop(session_id, None)
+
+
+    # Check if a session shares a speaker, topic or sponsor with a session already in the slot
+    def has_conflict(self, session: Session, day_index: int, slot_index: int) -> bool:
+        speaker_mask, topic_mask, sponsor_mask = self.get_masks(session)
+
+        return bool(self.speaker_bits[day_index][slot_index] & speaker_mask
+                    or self.topic_bits[day_index][slot_index] & topic_mask
+                    or self.sponsor_bits[day_index][slot_index] & sponsor_mask)
+
+
+    # Return which of speaker, topic or sponsor makes a session conflict with a slot, or None if nothing does
+    def conflict_reason(self, session: Session, day_index: int, slot_index: int) -> str:
+        speaker_mask, topic_mask, sponsor_mask = self.get_masks(session)
+
+        if self.speaker_bits[day_index][slot_index] & speaker_mask:
+            return 'speaker'
+        if self.topic_bits[day_index][slot_index] & topic_mask:
+            return 'topic'
+        if self.sponsor_bits[day_index][slot_index] & sponsor_mask:
+            return 'sponsor'
+        return None
+
+
+    # Check if a session would conflict with the slot once another session in it is taken out. This lets a
+    # move be evaluated without touching the log.
+    def has_conflict_without(self, session: Session, other: Session, day_index: int, slot_index: int) -> bool:
+        speaker_mask, topic_mask, sponsor_mask = self.get_masks(session)
+        other_speakers, other_topics, other_sponsors = self.get_masks(other)
+
+        return bool(self.speaker_bits[day_index][slot_index] & ~other_speakers & speaker_mask
+                    or self.topic_bits[day_index][slot_index] & ~other_topics & topic_mask
+                    or self.sponsor_bits[day_index][slot_index] & ~other_sponsors & sponsor_mask)
+
+
+    # Check if two sessions share a speaker, topic or sponsor
+    def shares_any(self, session: Session, other: Session) -> bool:
+        return any(a & b for a, b in zip(self.get_masks(session), self.get_masks(other)))
+
+
+    # Record a session's speakers, topic and sponsors in the slot
+    def add(self, session: Session, day_index: int, slot_index: int):
+        speaker_mask, topic_mask, sponsor_mask = self.get_masks(session)
+
+        self.speaker_bits[day_index][slot_index] |= speaker_mask
+        self.topic_bits[day_index][slot_index] |= topic_mask
+        self.sponsor_bits[day_index][slot_index] |= sponsor_mask
+
+
+    # Clear a session's speakers, topic and sponsors from the slot. Sessions in the same slot never share
+    # a bit because add_session rejects conflicts, so clearing the bits cannot affect other sessions.
+    def remove(self, session: Session, day_index: int, slot_index: int):
+        speaker_mask, topic_mask, sponsor_mask = self.get_masks(session)
+
+        self.speaker_bits[day_index][slot_index] &= ~speaker_mask
+        self.topic_bits[day_index][slot_index] &= ~topic_mask
+        self.sponsor_bits[day_index][slot_index] &= ~sponsor_mask
+
+
+    # Check if a session running from the first to the last slot conflicts with any of them. A session that spans
+    # slots is recorded in each of them, so two sessions overlap in time exactly when they share a slot.
+    def has_conflict_span(self, session: Session, day_index: int, first: int, last: int) -> bool:
+        if first == last:
+            return self.has_conflict(session, day_index, first)
+
+        return any(self.has_conflict(session, day_index, slot_index) for slot_index in range(first, last + 1))
+
+
+    # Return the reason of the first conflict of a session running from the first to the last slot, or None
+    def conflict_reason_span(self, session: Session, day_index: int, first: int, last: int) -> str:
+        for slot_index in range(first, last + 1):
+            reason = self.conflict_reason(session, day_index, slot_index)
+            if reason is not None:
+                return reason
+        return None
+
+
+    # Record a session in every slot from the first to the last
+    def add_span(self, session: Session, day_index: int, first: int, last: int):
+        for slot_index in range(first, last + 1):
+            self.add(session, day_index, slot_index)
+
+
+    # Clear a session from every slot from the first to the last
+    def remove_span(self, session: Session, day_index: int, first: int, last: int):
+        for slot_index in range(first, last + 1):
+            self.remove(session, day_index, slot_index)
+
+
+# An occupancy matrix records which session is scheduled in every room, day and slot. It is a single flat
+# array of session ID's laid out as [room][day][slot], with -1 marking a free slot, so rooms do not need a
+# placeholder session for every empty slot. A session longer than its first slot takes the run of consecutive
+# slots that covers its duration, and is recorded in every slot of the run.
+@dataclass
+class Occupancy:
+    num_rooms: int = 0                                      # Number of rooms in the matrix
+    num_days: int = 0                                       # Number of days in the matrix
+    num_slots: int = 0                                      # Number of slots in a day
+    cells: array = field(default_factory=lambda: array('i'))   # Session ID's of every room, day and slot
+    free_bits: list[int] = field(default_factory=list)         # Bitset of free slots of every room and day
+    start_minutes: list[int] = field(default_factory=list)     # Start of every slot in minutes after midnight
+    end_minutes: list[int] = field(default_factory=list)       # End of every slot in minutes after midnight
+    ordered: bool = True                                       # Whether slots follow each other without overlapping, so sessions can span them
+    times: dict = field(default_factory=dict)                  # Start and end times of placed sessions, shared per day and slot
+
+
+    # Create a matrix with every slot free
+    def matrix_init(self, num_rooms: int, num_days: int, num_slots: int):
+        self.num_rooms = num_rooms
+        self.num_days = num_days
+        self.num_slots = num_slots
+        self.cells = array('i', [-1]) * (num_rooms * num_days * num_slots)
+        self.free_bits = [(1 << num_slots) - 1] * (num_rooms * num_days)
+
+
+    # Record the times of the slots so sessions longer than a slot can be given a run of slots
+    def slots_init(self, start_times: list[datetime], end_times: list[datetime]):
+        self.start_minutes = [start.hour * 60 + start.minute for start in start_times]
+        self.end_minutes = [end.hour * 60 + end.minute for end in end_times]
+        self.ordered = all(self.end_minutes[i] <= self.start_minutes[i + 1] for i in range(len(start_times) - 1))
+
+
+    # Return the last slot of the run a session of the given duration needs when it starts in the slot, found by
+    # bisecting the slot ends, or -1 if the day ends first. Breaks between slots count towards the duration.
+    def span(self, slot_index: int, duration: int) -> int:
+        if duration <= self.end_minutes[slot_index] - self.start_minutes[slot_index]:
+            return slot_index
+        if not self.ordered:
+            return -1
+
+        last = bisect_left(self.end_minutes, self.start_minutes[slot_index] + duration, slot_index)
+        return last if last < len(self.end_minutes) else -1
+
+
+    # Return the bitset of the slots from the first to the last
+    def run_mask(self, first: int, last: int) -> int:
+        return ((1 << (last - first + 1)) - 1) << first
+
+
+    # Return the bitset of the slots that start a run of at least the given number of free slots in a room's
+    # day. Doubling the run covered by each shift takes O(log length) operations on the free bitset.
+    def free_runs(self, row: int, day_index: int, length: int) -> int:
+        runs = self.free_bits[row * self.num_days + day_index]
+        covered = 1
+
+        while covered < length and runs:
+            step = min(covered, length - covered)
+            runs &= runs >> step
+            covered += step
+
+        return runs
+
+
+    # Add a row of free slots for a new room and return its index
+    def add_row(self) -> int:
+        self.cells.extend(array('i', [-1]) * (self.num_days * self.num_slots))
+        self.free_bits.extend([(1 << self.num_slots) - 1] * self.num_days)
+        self.num_rooms += 1
+        return self.num_rooms - 1
+
+
+    # Delete a room's row. The rows after it move up by one.
+    def remove_row(self, row: int):
+        start = row * self.num_days
+        del self.cells[start * self.num_slots:(start + self.num_days) * self.num_slots]
+        del self.free_bits[start:start + self.num_days]
+        self.num_rooms -= 1
+
+
+    # Return the position of a room, day and slot in the flat array
+    def offset(self, row: int, day_index: int, slot_index: int) -> int:
+        return (row * self.num_days + day_index) * self.num_slots + slot_index
+
+
+    # Return the ID of the session in the slot, or -1 if the slot is free
+    def get(self, row: int, day_index: int, slot_index: int) -> int:
+        return self.cells[self.offset(row, day_index, slot_index)]
+
+
+    # Check if the slot is free
+    def is_free(self, row: int, day_index: int, slot_index: int) -> bool:
+        return self.cells[self.offset(row, day_index, slot_index)] == -1
+
+
+    # Place a session in the slot
+    def set(self, row: int, day_index: int, slot_index: int, session_id: int):
+        self.cells[self.offset(row, day_index, slot_index)] = session_id
+        self.free_bits[row * self.num_days + day_index] &= ~(1 << slot_index)
+
+
+    # Free the slot
+    def clear(self, row: int, day_index: int, slot_index: int):
+        self.cells[self.offset(row, day_index, slot_index)] = -1
+        self.free_bits[row * self.num_days + day_index] |= 1 << slot_index
+
+
+    # Place a session in every slot from the first to the last
+    def set_span(self, row: int, day_index: int, first: int, last: int, session_id: int):
+        start = self.offset(row, day_index, 0)
+        for slot_index in range(first, last + 1):
+            self.cells[start + slot_index] = session_id
+        self.free_bits[row * self.num_days + day_index] &= ~self.run_mask(first, last)
+
+
+    # Free every slot from the first to the last
+    def clear_span(self, row: int, day_index: int, first: int, last: int):
+        start = self.offset(row, day_index, 0)
+        for slot_index in range(first, last + 1):
+            self.cells[start + slot_index] = -1
+        self.free_bits[row * self.num_days + day_index] |= self.run_mask(first, last)
+
+
+    # Return the bitset of the given slot indexes
+    def slot_mask(self, slot_indexes: list[int]) -> int:
+        mask = 0
+
+        for slot_index in slot_indexes:
+            mask |= 1 << slot_index
+
+        return mask
+
+
+    # Return the number of free slots in the slot mask over the given days, for each of the given rooms
+    def count_free(self, rows: list[int], day_indexes: list[int], slot_mask: int) -> list[int]:
+        free_bits = self.free_bits
+        counts = []
+
+        for row in rows:
+            base = row * self.num_days
+            counts.append(sum((free_bits[base + day_index] & slot_mask).bit_count() for day_index in day_indexes))
+
+        return counts
+
+
+    # Return a copy of one room's session ID's for one day. A copy rather than a memoryview, since the matrix
+    # cannot grow or shrink while views of it are held.
+    def day_cells(self, row: int, day_index: int) -> array:
+        start = self.offset(row, day_index, 0)
+        return self.cells[start:start + self.num_slots]
+
+
+# A feasibility table tells which rooms of a schedule can host a session, as a bitset of occupancy rows. A room
+# can host a session if it seats the session's estimated capacity and is either unequipped or has all of the
+# session's equipment. Sessions share capacities and equipment tuples, so the table keeps one bitset per seat
+# count and one per equipment tuple, and a session's rooms are the AND of the two. It is built once per schedule.
+# A room that picks up equipment only updates its own bit in the equipment bitsets; adding, removing or changing
+# rooms clears the table, which then fills again as sessions are looked up. The version counts these changes so
+# that lists built from the table know when to rebuild.
+@dataclass
+class FeasibilityTable:
+    rooms: list['Room'] = field(default_factory=list)                             # Rooms of the schedule, by occupancy row
+    capacity_rows: dict[int, int] = field(default_factory=dict)                 # Maps seat counts to the bitset of rooms seating as many
+    equipment_rows: dict[tuple[str, ...], int] = field(default_factory=dict)    # Maps equipment tuples to the bitset of rooms that can provide them
+    version: int = 0                                                            # Number of times the table has changed
+
+
+    # Fill the table for the given rooms and sessions
+    def table_init(self, rooms: list['Room'], sessions: list[Session]):
+        self.rooms = rooms
+        self.clear()
+        for session in sessions:
+            self.rows(session)
+
+
+    # Forget every cached bitset
+    def clear(self):
+        self.capacity_rows = {}
+        self.equipment_rows = {}
+        self.version += 1
+
+
+    # Return the bitset of rooms seating at least the given number of people
+    def capacity_mask(self, capacity: int) -> int:
+        mask = self.capacity_rows.get(capacity)
+
+        if mask is None:
+            mask = 0
+            for room in self.rooms:
+                if room.max_capacity >= capacity:
+                    mask |= 1 << room.row
+            self.capacity_rows[capacity] = mask
+
+        return mask
+
+
+    # Return whether a room can provide the given equipment, which an unequipped room always can
+    def provides(self, room: 'Room', equipment: tuple[str, ...]) -> bool:
+        return equipment == ('',) or room.equipment == [] or set(equipment).issubset(room.equipment)
+
+
+    # Return the bitset of rooms that can provide the given equipment
+    def equipment_mask(self, equipment: tuple[str, ...]) -> int:
+        mask = self.equipment_rows.get(equipment)
+
+        if mask is None:
+            mask = 0
+            for room in self.rooms:
+                if self.provides(room, equipment):
+                    mask |= 1 << room.row
+            self.equipment_rows[equipment] = mask
+
+        return mask
+
+
+    # Return the bitset of rooms that can host the session
+    def rows(self, session: Session) -> int:
+        return self.capacity_mask(session.est_capacity) & self.equipment_mask(session.equipment)
+
+
+    # Update a room's bit in every equipment bitset after its equipment changed
+    def update_room(self, room: 'Room'):
+        bit = 1 << room.row
+        for equipment, mask in self.equipment_rows.items():
+            self.equipment_rows[equipment] = mask | bit if self.provides(room, equipment) else mask & ~bit
+        self.version += 1
+
+
 # A room is where sessions will be scheduled in. Each room will contain scheduled sessions
 # throughout one or more days. A room should have some pre-determined attributes like capacity
 # but also some attributes that will be updated dynamically like equipment since rooms are equipped
 # to match the session it is trying to schedule.
-@dataclass
+@dataclass(slots=True)
 class Room:
     room_id: int                                                    # Unique room indentifier
     max_capacity: int                                               # Maximum number of people allowed
@@ -57,32 +509,44 @@ class Room:
     floor: int                                                      # Floor number the room is on
     format: str = ""                                                # Format of room (e.g., roundtable)
     equipment: list[str] = field(default_factory=list)              # List of equipment needed (e.g., WiFi)
-    schedule: list[list[Session]] = field(default_factory=list)     # List of session lists that represent daily schedules
+    occupancy: Occupancy = None                                     # Occupancy matrix of the schedule this room belongs to
+    row: int = -1                                                   # Index of this room in the occupancy matrix
     slots: int = 0                                                  # Number of slots in a schedule
+    feasibility: FeasibilityTable = None                            # Table of the rooms each session of the schedule fits in
 
 
-    # Create a blank schedule with slots in between ROOM_START and ROOM_END 
-    def schedule_init(self, num_slots: int, start_times: list[datetime], end_times: list[datetime], day: datetime):   
-        empty_list = []
+    # Attach the room to its row of the schedule's occupancy matrix and to the schedule's feasibility table
+    def schedule_init(self, occupancy: Occupancy, row: int, feasibility: FeasibilityTable = None):
+        self.occupancy = occupancy
+        self.row = row
+        self.slots = occupancy.num_slots
+        self.feasibility = feasibility
 
-        for slot_index in range(num_slots):
-            empty_slot = Session(-1, 0, 0, 'Emtpy', 'Empty', 'Empty', 'Empty', [], [], [])
-            empty_slot.set_time(start_times[slot_index], end_times[slot_index], day)
-            empty_list.append(empty_slot)
 
-        self.schedule += [empty_list]
-        self.slots = num_slots
+    # Daily schedules of this room as lists of session ID's, with -1 marking a free slot
+    @property
+    def schedule(self) -> list[array]:
+        return [self.occupancy.day_cells(self.row, day_index) for day_index in range(self.occupancy.num_days)]
 
 
     # Add equipment to room
     def add_equipment(self, equipment: list[str]):
         self.equipment.extend(equipment)
+        if self.feasibility is not None:
+            self.feasibility.update_room(self)
+
+
+    # Replace the room's equipment, keeping the feasibility table up to date
+    def set_equipment(self, equipment: list[str]):
+        self.equipment = equipment
+        if self.feasibility is not None:
+            self.feasibility.update_room(self)
 
 
     # Check if the session is compatible with this room
     def check_compatible(self, session: Session) -> bool:
         # Check if this room has the equipment needed by the session
-        if session.equipment != [''] and self.equipment != [] and not set(session.equipment).issubset(self.equipment):
+        if session.equipment != ('',) and self.equipment != [] and not set(session.equipment).issubset(self.equipment):
             return False
 
         # Check if the session's estimated capacity exceeds this room's maximum capacity
@@ -92,41 +556,49 @@ class Room:
         return True
 
 
-    # Add the session to the specified day's schedule
-    def add_session(self, session: Session, day_index: int, day: datetime, slots: list[int], start_times: list[datetime], end_times: list[datetime], speaker_log, topic_log, sponsor_log) -> bool:
+    # Add the session to the specified day's schedule, starting in the first of the given slots where it fits. A
+    # session longer than its starting slot takes the following slots too; with within, those must all be in that
+    # slot bitset. Returns whether the session was placed; the rejected rooms and slots are counted in metrics
+    # if given.
+    def add_session(self, session: Session, day_index: int, day: datetime, slots: list[int], start_times: list[datetime], end_times: list[datetime], conflicts: ConflictLog, metrics: Metrics = None, within: int = None) -> bool:
         # Check if the session and room are compatible
         if not self.check_compatible(session):
+            if metrics is not None:
+                metrics.reject('capacity' if session.est_capacity > self.max_capacity else 'equipment')
             return False
 
-        sched = self.schedule[day_index]
+        occupancy = self.occupancy
 
         for i in slots:
-            is_valid = True
-            slot_duration = (end_times[i] - start_times[i]).total_seconds() / 60.0
-
-            if sched[i].session_id != -1:                                         # Check if the schedule at this index already has a session
+            if not occupancy.is_free(self.row, day_index, i):                     # Check if the schedule at this index already has a session
+                if metrics is not None:
+                    metrics.reject('occupied')
                 continue
-            elif session.duration > slot_duration:                                # Check if session duration exceeds slot duration
-                continue
-            elif set(speaker_log[day_index][i]).intersection(session.speaker):    # Check if there is a speaker conflict
+
+            last = occupancy.span(i, session.duration)                            # Find the slots the session needs to cover its duration
+            if last == -1 or (last != i and within is not None and occupancy.run_mask(i, last) & ~within):
+                if metrics is not None:
+                    metrics.reject('duration')
                 continue
-            elif session.topic in topic_log[day_index][i]:                        # Check if there is a topic conflict
+            elif last != i and occupancy.free_bits[self.row * occupancy.num_days + day_index] & occupancy.run_mask(i, last) != occupancy.run_mask(i, last):
+                if metrics is not None:
+                    metrics.reject('occupied')
                 continue
-            elif session.sponsors != [''] and set(session.sponsors).intersection(sponsor_log[day_index][i]):   # Check if there is a sponsor conflict
+            elif conflicts.has_conflict_span(session, day_index, i, last):        # Check if there is a speaker, topic or sponsor conflict
+                if metrics is not None:
+                    metrics.reject(conflicts.conflict_reason_span(session, day_index, i, last))
                 continue
 
             # Insert the session if there is enough open space
-            session.set_time(start_times[i], end_times[i], day)
+            session.set_time(start_times[i], end_times[last], day, occupancy.times)
             session.set_room(self.room_id)
-            self.schedule[day_index][i] = session
+            occupancy.set_span(self.row, day_index, i, last, session.session_id)
             
-            if self.equipment == [] and session.equipment != ['']:
+            if self.equipment == [] and session.equipment != ('',):
                 self.add_equipment(session.equipment)
 
-            # Update speaker and topic logs
-            speaker_log[day_index][i] = speaker_log[day_index][i] + session.speaker
-            topic_log[day_index][i] = topic_log[day_index][i] + [session.topic]
-            sponsor_log[day_index][i] = sponsor_log[day_index][i] + session.sponsors
+            # Update speaker, topic and sponsor logs
+            conflicts.add_span(session, day_index, i, last)
             return True
 
         return False
@@ -139,14 +611,212 @@ class Room:
         print(f'   Format: {self.format}')
         for i in range(len(days)):
             print(f'\n   Day {days[i].date()}:')
-            for j in range(len(self.schedule[i])):
-                if(self.schedule[i][j].session_id == -1):
+            for j in range(self.slots):
+                if self.occupancy.is_free(self.row, i, j):
                     print(f'   {start_times[j].time()} - {end_times[j].time()}:')
                 else:
-                    print(f'   {start_times[j].time()} - {end_times[j].time()}: {self.schedule[i][j].session_id}')
+                    print(f'   {start_times[j].time()} - {end_times[j].time()}: {self.occupancy.get(self.row, i, j)}')
         print()
 
 
+# A room index keeps a set of rooms sorted by capacity so the scheduler can go straight to the smallest rooms
+# that can seat a session, leaving large rooms for large sessions. Equipment is interned to bit positions and
+# each room keeps an equipment bitset, so an equipment check is a single AND.
+@dataclass
+class RoomIndex:
+    rooms: list[Room] = field(default_factory=list)                 # Rooms sorted by capacity in ascending order
+    capacities: list[int] = field(default_factory=list)             # Maximum capacity of each room in rooms
+    equipment_ids: dict[str, int] = field(default_factory=dict)     # Maps equipment to bit positions
+    equipment_masks: list[int] = field(default_factory=list)        # Equipment bitset of each room in rooms, or -1 if unequipped
+    positions: dict[int, int] = field(default_factory=dict)         # Maps room ID's to indexes of rooms
+    feasibility: FeasibilityTable = None                            # Feasibility table of the rooms' schedule, if they belong to one
+    cache: dict[tuple[int, tuple[str, ...]], list[Room]] = field(default_factory=dict)  # Candidates by seat count and equipment
+    version: int = -1                                               # Version of the feasibility table the cache was built from
+
+
+    # Sort the rooms by capacity, keeping the given order among rooms of equal capacity. Rooms of a schedule are
+    # checked against the schedule's feasibility table instead of the index's own equipment bitsets.
+    def index_init(self, rooms: list[Room], feasibility: FeasibilityTable = None):
+        self.feasibility = feasibility
+        self.rooms = sorted(rooms, key=attrgetter('max_capacity'))
+        self.capacities = [room.max_capacity for room in self.rooms]
+        self.positions = {self.rooms[i].room_id: i for i in range(len(self.rooms))}
+        self.equipment_masks = [self.room_mask(room) for room in self.rooms]
+
+
+    # Return the bitset of the given equipment, assigning new bit positions to equipment seen for the first time
+    def equipment_mask(self, equipment: list[str]) -> int:
+        mask = 0
+
+        for item in equipment:
+            if item == '':
+                continue
+            if item not in self.equipment_ids:
+                self.equipment_ids[item] = len(self.equipment_ids)
+            mask |= 1 << self.equipment_ids[item]
+
+        return mask
+
+
+    # Return the equipment bitset of a room, or -1 if the room has not been equipped yet
+    def room_mask(self, room: Room) -> int:
+        return -1 if room.equipment == [] else self.equipment_mask(room.equipment)
+
+
+    # Refresh a room's equipment bitset after the room has been equipped
+    def update_equipment(self, room: Room):
+        self.equipment_masks[self.positions[room.room_id]] = self.room_mask(room)
+
+
+    # Return the rooms that can seat the session and have its equipment, smallest first. With a feasibility table,
+    # sessions of the same capacity and equipment share one list until the table changes, so the list must not be
+    # changed by the caller.
+    def candidates(self, session: Session) -> list[Room]:
+        if self.feasibility is not None:
+            if self.version != self.feasibility.version:
+                self.cache = {}
+                self.version = self.feasibility.version
+
+            key = (session.est_capacity, session.equipment)
+            rooms = self.cache.get(key)
+
+            if rooms is None:
+                rows = self.feasibility.rows(session)
+                rooms = [room for room in self.rooms[bisect_left(self.capacities, session.est_capacity):] if rows >> room.row & 1]
+                self.cache[key] = rooms
+
+            return rooms
+
+        session_mask = self.equipment_mask(session.equipment)
+        rooms = []
+
+        for i in range(bisect_left(self.capacities, session.est_capacity), len(self.rooms)):
+            room_mask = self.equipment_masks[i]
+
+            if room_mask == -1 or session_mask & ~room_mask == 0:
+                rooms.append(self.rooms[i])
+
+        return rooms
+
+
+# A facet index maps each format, topic, type and sponsor to the bitset of unscheduled sessions that have it, so
+# session filters become unions and intersections of bitsets and facet counts become bit counts. Empty values
+# are indexed too, because the filters treat them like any other value, but they are not listed as facets.
+@dataclass
+class FacetIndex:
+    positions: dict[int, int] = field(default_factory=dict)             # Maps session ID's to bit positions
+    session_ids: list[int] = field(default_factory=list)                # Session ID at each bit position
+    bits: dict[str, dict[str, int]] = field(default_factory=dict)       # Maps facet names to values to bitsets of unscheduled sessions
+    unscheduled: int = 0                                                # Bitset of all unscheduled sessions
+
+    FACETS = ('format', 'topic', 'type', 'sponsors')
+
+
+    # Index the given unscheduled sessions
+    def index_init(self, sessions: list[Session]):
+        self.positions = {}
+        self.session_ids = []
+        self.bits = {facet: {} for facet in self.FACETS}
+        self.unscheduled = 0
+
+        for sess in sessions:
+            self.add(sess)
+
+
+    # Return the values of a facet of a session
+    def values(self, session: Session, facet: str) -> list[str]:
+        value = getattr(session, facet)
+        return value if facet == 'sponsors' else [value]
+
+
+    # Mark a session as unscheduled, giving it a bit position if it has none yet
+    def add(self, session: Session):
+        if session.session_id not in self.positions:
+            self.positions[session.session_id] = len(self.session_ids)
+            self.session_ids.append(session.session_id)
+
+        bit = 1 << self.positions[session.session_id]
+        self.unscheduled |= bit
+
+        for facet in self.FACETS:
+            values = self.bits[facet]
+            for value in self.values(session, facet):
+                values[value] = values.get(value, 0) | bit
+
+
+    # Mark a session as scheduled or removed
+    def remove(self, session: Session):
+        if session.session_id not in self.positions:
+            return
+
+        bit = 1 << self.positions[session.session_id]
+        self.unscheduled &= ~bit
+
+        for facet in self.FACETS:
+            values = self.bits[facet]
+            for value in self.values(session, facet):
+                if value in values:
+                    values[value] &= ~bit
+                    if values[value] == 0:
+                        del values[value]
+
+
+    # Return the bitset of the unscheduled sessions that pass the filter of one facet. Sessions pass when their
+    # value is selected; for sponsors, every one of their sponsors must be selected. No selection passes everything.
+    def match(self, facet: str, selected: list[str]) -> int:
+        if len(selected) == 0:
+            return self.unscheduled
+
+        values = self.bits[facet]
+        if facet == 'sponsors':
+            rejected = 0
+            for value, bits in values.items():
+                if value not in selected:
+                    rejected |= bits
+            return self.unscheduled & ~rejected
+
+        mask = 0
+        for value in selected:
+            mask |= values.get(value, 0)
+        return mask
+
+
+    # Return the bitset of the unscheduled sessions that pass the filters of all facets
+    def filter(self, selected: dict[str, list[str]]) -> int:
+        mask = self.unscheduled
+
+        for facet in self.FACETS:
+            if selected.get(facet):
+                mask &= self.match(facet, selected[facet])
+
+        return mask
+
+
+    # Return the ID's of the sessions in a bitset, in the order they were indexed
+    def decode(self, mask: int) -> list[int]:
+        digits = bin(mask)[:1:-1]
+        ids = []
+
+        i = digits.find('1')
+        while i != -1:
+            ids.append(self.session_ids[i])
+            i = digits.find('1', i + 1)
+
+        return ids
+
+
+    # Return, for every facet, the number of sessions with each non-empty value among the sessions that pass the
+    # filters of the other facets, so the counts show what selecting one more value would give
+    def counts(self, selected: dict[str, list[str]]) -> dict[str, dict[str, int]]:
+        counts = {}
+
+        for facet in self.FACETS:
+            others = self.filter({name: values for name, values in selected.items() if name != facet})
+            counts[facet] = {value: (bits & others).bit_count() for value, bits in self.bits[facet].items() if value != ''}
+
+        return counts
+
+
 # A schedule will contain a list of scheduled rooms and unscheduled sessions. Multiple schedules can 
 # be made to contain different sets of rooms and sessions to schedule. If a session can be successfully 
 # scheduled into a room, that room will be added to a list of scheduled rooms to be sent to the user. 
@@ -164,26 +834,88 @@ class Schedule:
     rooms_sched: dict[int, Room] = field(default_factory=dict)            # Maps room ID's to rooms
     sessions_scheduled: list[Session] = field(default_factory=list)       # List of scheduled sessions
     sessions_not_scheduled: list[Session] = field(default_factory=list)   # List of session not able to be scheduled
-    speaker_log: list[list[list[str]]] = field(default_factory=list)      # List of speakers in each time slot for each day
-    topic_log: list[list[list[str]]] = field(default_factory=list)        # List of topics in each time slot for each day
-    sponsor_log: list[list[list[str]]] = field(default_factory=list)     # List of sponsors and cosponsors in each time slot for each day
+    conflict_log: ConflictLog = field(default_factory=ConflictLog)        # Speakers, topics and sponsors in each time slot for each day
+    occupancy: Occupancy = field(default_factory=Occupancy)               # Session ID's scheduled in each room, day and slot
+    session_index: dict[int, Session] = field(default_factory=dict)      # Maps session ID's to sessions
+    unscheduled_index: dict[int, Session] = field(default_factory=dict)  # Maps session ID's to sessions not scheduled yet
+    room_lookup: dict[int, Room] = field(default_factory=dict)           # Maps room ID's to rooms
+    run_rooms: dict[int, Room] = field(default_factory=dict)             # Rooms used by scheduling runs so far, by room ID
+    run_days: dict[int, None] = field(default_factory=dict)              # Day indexes used by scheduling runs so far
+    run_slots: dict[int, None] = field(default_factory=dict)             # Slot indexes used by scheduling runs so far
+    facet_index: FacetIndex = field(default_factory=FacetIndex)          # Formats, topics, types and sponsors of unscheduled sessions
+    speaker_index: dict[int, Speaker] = field(default_factory=dict)      # Maps speaker ID's to speakers
+    slot_lookup: dict[time, int] = field(default_factory=dict)           # Maps slot start times to indexes of start_times
+    day_lookup: dict[date, int] = field(default_factory=dict)            # Maps dates to indexes of days
+    session_speakers: dict[int, list[int]] = field(default_factory=dict) # Maps session ID's to the ID's of their speakers
+    progress: Callable[[int], None] = None                               # Called with the day index (-1 outside a day) as scheduling goes on
+    metrics: Metrics = None                                              # Rejection counts and phase timings while enabled, otherwise None
+    feasibility: FeasibilityTable = field(default_factory=FeasibilityTable)  # Rooms each session can be hosted in
+
+
+    # The progress callback belongs to the running process, so it is left out of copies and pickles
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['progress'] = None
+        return state
+
+
+    # Create a blank log for speaker, topic and sponsor conflicts
+    def logs_init(self):
+        self.conflict_log.num_slots = len(self.start_times)
+        self.conflict_log.day_init()
 
 
-    # Create a blank log for speaker and topic logs
-    def logs_init(self):
-        self.topic_log += [[[]] * len(self.start_times)]
-        self.speaker_log += [[[]] * len(self.start_times)]
-        self.sponsor_log += [[[]] * len(self.start_times)]
+    # Index sessions by ID and mark all of them as unscheduled
+    def sessions_init(self):
+        self.session_index = {sess.session_id: sess for sess in self.all_sessions}
+        self.unscheduled_index = dict(self.session_index)
+        self.facet_index.index_init(self.all_sessions)
+
+
+    # Index speakers by ID, build the session to speakers mapping if the parser did not provide one and fill in
+    # the speakers of sessions that have none
+    def speakers_init(self):
+        self.speaker_index = {speaker.speaker_id: speaker for speaker in self.speakers}
+
+        if not self.session_speakers:
+            for speaker in self.speakers:
+                for session_id in speaker.session_ids:
+                    self.session_speakers.setdefault(session_id, []).append(speaker.speaker_id)
+
+        # Sessions that did not list their speakers take them from the speakers' session ID's
+        for sess in self.all_sessions:
+            if not sess.speaker:
+                sess.speaker = tuple(self.session_speakers.get(sess.session_id, ()))
+
+
+    # Build lookup tables from slot start times and dates to their indexes
+    def lookups_init(self):
+        self.slot_lookup = {}
+        self.day_lookup = {}
+
+        for i in range(len(self.start_times)):
+            self.slot_lookup.setdefault(self.start_times[i].time(), i)
+
+        for i in range(len(self.days)):
+            self.day_lookup.setdefault(self.days[i].date(), i)
 
 
     def init(self):
+        self.sessions_init()
+        self.speakers_init()
+        self.lookups_init()
+
         for i in range(len(self.days)):
             # Initialize logs
             self.logs_init()
 
-            # Initalize room schedules
-            for room in self.all_rooms:
-                room.schedule_init(len(self.start_times), self.start_times, self.end_times, self.days[i])
+        # Initalize room schedules
+        self.room_lookup = {room.room_id: room for room in self.all_rooms}
+        self.occupancy.matrix_init(len(self.all_rooms), len(self.days), len(self.start_times))
+        self.occupancy.slots_init(self.start_times, self.end_times)
+        for i in range(len(self.all_rooms)):
+            self.all_rooms[i].schedule_init(self.occupancy, i, self.feasibility)
+        self.feasibility.table_init(self.all_rooms, self.all_sessions)
 
 
     # Print schedule
@@ -196,11 +928,17 @@ class Schedule:
     
     # Get speaker object given the speaker's ID
     def get_speaker(self, id: int) -> Speaker:
-        for speaker in self.speakers:
-            if speaker.speaker_id == id:
-                return speaker
-        
-        return None
+        return self.speaker_index.get(id)
+
+
+    # Get the speakers assigned to a session given the session's ID
+    def get_session_speakers(self, id: int) -> list[Speaker]:
+        return [self.speaker_index[speaker_id] for speaker_id in self.session_speakers.get(id, []) if speaker_id in self.speaker_index]
+
+
+    # Get session object given the session's ID
+    def get_session(self, id: int) -> Session:
+        return self.session_index.get(id)
 
 
     # Return scheduled sessions in a list
@@ -210,29 +948,73 @@ class Schedule:
 
     # Return unscheduled sessions in a list
     def get_unscheduled_sessions(self) -> list[Session]:
-        if len(self.sessions_scheduled) == 0:
-            return self.all_sessions
+        return list(self.unscheduled_index.values())
 
-        unscheduled = []
-        for sess in self.all_sessions:
-            unscheduled.append(sess)
-            for sched_sess in self.sessions_scheduled:
-                if sess.session_id == sched_sess.session_id:
-                    unscheduled.remove(sess)
-                    break
 
-        return unscheduled
+    # Check if a session has not been scheduled yet
+    def is_unscheduled(self, id: int) -> bool:
+        return id in self.unscheduled_index
 
 
-    # Return a set of session formats needed by sessions that haven't been schedule yet
-    def get_session_formats(self) -> set[str]:
-        formats = set()
+    # Mark a session as scheduled and take it out of the facets of unscheduled sessions
+    def mark_scheduled(self, session: Session):
+        self.sessions_scheduled.append(session)
+        self.unscheduled_index.pop(session.session_id, None)
+        self.facet_index.remove(session)
 
-        for sess in self.get_unscheduled_sessions():
-            if sess.format != "":
-                formats.add(sess.format)
 
-        return formats
+    # Return the room, day index and slot index a scheduled session is placed in
+    def get_placement(self, session: Session) -> tuple[Room, int, int]:
+        return self.room_lookup[session.assigned_room], self.day_lookup[session.start_time.date()], self.slot_lookup[session.start_time.time()]
+
+
+    # Return the index of the last slot a scheduled session takes
+    def get_last_slot(self, session: Session) -> int:
+        return self.occupancy.span(self.slot_lookup[session.start_time.time()], session.duration)
+
+
+    # Place a session into a specific room, day and slot (and the slots after it that its duration needs) if the
+    # slots are free and nothing conflicts
+    def place_session(self, session: Session, room: Room, day_index: int, slot_index: int) -> bool:
+        if not room.add_session(session, day_index, self.days[day_index], [slot_index], self.start_times, self.end_times, self.conflict_log, self.metrics):
+            return False
+
+        self.rooms_sched.setdefault(room.room_id, room)
+        self.mark_scheduled(session)
+        return True
+
+
+    # Take a scheduled session out of its slot and mark it as unscheduled again. Equipment the session brought
+    # into its room stays in the room.
+    def unplace_session(self, session: Session):
+        room, day_index, slot_index = self.get_placement(session)
+        last = self.get_last_slot(session)
+
+        self.occupancy.clear_span(room.row, day_index, slot_index, last)
+        self.conflict_log.remove_span(session, day_index, slot_index, last)
+        self.sessions_scheduled.remove(session)
+        self.unscheduled_index[session.session_id] = session
+        self.facet_index.add(session)
+
+        session.set_room(0)
+        session.start_time = NOT_SCHEDULED
+        session.end_time = NOT_SCHEDULED
+
+
+    # Return the formats, topics, types and sponsors of unscheduled sessions, read off the facet index
+    def get_session_facets(self) -> dict[str, set[str]]:
+        return {facet: {value for value in values if value != ''} for facet, values in self.facet_index.bits.items()}
+
+
+    # Return, for every facet, the number of unscheduled sessions with each value among the sessions that pass the
+    # filters on the other facets
+    def get_facet_counts(self, types: list[str], formats: list[str], sponsors: list[str], topics: list[str]) -> dict[str, dict[str, int]]:
+        return self.facet_index.counts({'type': types, 'format': formats, 'sponsors': sponsors, 'topic': topics})
+
+
+    # Return a set of session formats needed by sessions that haven't been schedule yet
+    def get_session_formats(self) -> set[str]:
+        return self.get_session_facets()['format']
 
     
     # Return a set of room formats from all rooms
@@ -270,35 +1052,17 @@ class Schedule:
 
     # Return a set of session topics
     def get_session_topics(self) -> set[str]:
-        topics = set()
-
-        for sess in self.get_unscheduled_sessions():
-            if sess.topic != "":
-                topics.add(sess.topic)
-
-        return topics
+        return self.get_session_facets()['topic']
 
 
     # Return a set of session types
     def get_session_types(self) -> set[str]:
-        types = set()
-
-        for sess in self.get_unscheduled_sessions():
-            if sess.type != "":
-                types.add(sess.type)
-
-        return types
+        return self.get_session_facets()['type']
 
 
     # Return a set of sponsors
     def get_session_sponsors(self) -> set[str]:
-        sponsors = set()
-
-        for sess in self.get_unscheduled_sessions():
-            if sess.sponsors != [""]:
-                sponsors.update(sess.sponsors)
-
-        return sponsors
+        return self.get_session_facets()['sponsors']
 
 
     # Returns the max capacity of all rooms
@@ -323,119 +1087,483 @@ class Schedule:
         return min
 
 
-    # Get index of slot in start_times list
-    def get_slot_index(self, time: datetime) -> int:
-        time_index = -1
-        
-        for i in range(len(self.start_times)):
-            if self.start_times[i].time() == time.time():
-                time_index = i
-        
-        return time_index
+    # Get index of slot in start_times list. Accepts a slot index or a datetime with the slot's start time.
+    def get_slot_index(self, time: datetime | int) -> int:
+        if isinstance(time, int):
+            if not 0 <= time < len(self.start_times):
+                raise ValueError(f'Slot index {time} is out of range for {len(self.start_times)} slots')
+            return time
 
+        slot_index = self.slot_lookup.get(time.time())
+        if slot_index is None:
+            raise ValueError(f'{time.time()} is not the start time of any slot')
 
-    # Get index of days in days list
-    def get_day_index(self, day: datetime):
-        day_index = -1
+        return slot_index
+
+
+    # Get index of days in days list. Accepts a day index or a datetime on that day.
+    def get_day_index(self, day: datetime | int) -> int:
+        if isinstance(day, int):
+            if not 0 <= day < len(self.days):
+                raise ValueError(f'Day index {day} is out of range for {len(self.days)} days')
+            return day
+
+        day_index = self.day_lookup.get(day.date())
+        if day_index is None:
+            raise ValueError(f'{day.date()} is not one of the scheduled days')
 
-        for i in range(len(self.days)):
-            if self.days[i].date() == day.date():
-                day_index = i
-        
         return day_index
 
 
-    # Get list of sessions that match filters
+    # Get list of unscheduled sessions that match filters, as an intersection of facet index bitsets
     def get_filtered_sessions(self, types: list[str], formats: list[str], sponsors: list[str], topics: list[str]):
-        compatible_sessions = []
-        
-        for session in self.get_unscheduled_sessions():
-            if len(types) > 0 and session.type not in types:
-                continue
-            elif len(formats) > 0 and session.format not in formats:
-                continue
-            elif len(sponsors) > 0 and not set(session.sponsors).issubset(sponsors):
-                continue
-            elif len(topics) > 0 and session.topic not in topics:
-                continue
-
-            compatible_sessions.append(session)
+        mask = self.facet_index.filter({'type': types, 'format': formats, 'sponsors': sponsors, 'topic': topics})
+        return [self.session_index[id] for id in self.facet_index.decode(mask)]
 
-        return compatible_sessions
 
+    # Return a mask over all_rooms of the rooms that pass the room filters. The filters do not depend on the
+    # day or slot, so they are evaluated once per room.
+    def get_room_mask(self, properties: list[str], equipment: list[str], capacity: int, formats: list[str], min_capacity: int) -> list[bool]:
+        mask = []
 
-    # Get list of rooms that match filters and the number of available slots of specified days and times
-    def get_filtered_room_availability(self, days: list[datetime], times: list[datetime], properties: list[str], equipment: list[str], capacity: int, formats: list[str], selected_sessions: list[Session]) -> list[tuple()]:
-        compatible_rooms = []
-        min_capacity = self.get_session_min_capacity(selected_sessions)
-       
-        
         for room in self.all_rooms:
-            num_available = 0
+            if len(equipment) > 0 and not set(room.equipment).issubset(equipment):      # Check if this room's equipment is a subset of the filtered equipment
+                mask.append(False)
+            elif not capacity == None and room.max_capacity > capacity:                 # Check if room's capacity exceeds the filtered capacity
+                mask.append(False)
+            elif room.max_capacity < min_capacity:                                      # Check if room's capacity is less than the minimum capacity of selected sessions
+                mask.append(False)
+            elif len(formats) > 0 and not room.format in formats:                       # Check if the room's format is in the list of filtered formats
+                mask.append(False)
+            elif len(properties) > 0 and not room.property in properties:               # Check if the room's property is in the list of filtered properties
+                mask.append(False)
+            else:
+                mask.append(True)
+
+        return mask
 
-            for day in days:
-                day_index = self.get_day_index(day)
 
-                for time in times:
-                    slot_index = self.get_slot_index(time)
+    # Get list of rooms that match filters and the number of available slots of specified days and times
+    def get_filtered_room_availability(self, days: list[datetime | int], times: list[datetime | int], properties: list[str], equipment: list[str], capacity: int, formats: list[str], selected_sessions: list[Session]) -> list[tuple()]:
+        min_capacity = self.get_session_min_capacity(selected_sessions)
+        day_indexes = [self.get_day_index(day) for day in days]
+        slot_mask = self.occupancy.slot_mask([self.get_slot_index(time) for time in times])
+        room_mask = self.get_room_mask(properties, equipment, capacity, formats, min_capacity)
 
-                    if len(equipment) > 0 and not set(room.equipment).issubset(equipment):      # Check if this room's equipment is a subset of the filtered equipment
-                        continue
-                    elif not capacity == None and room.max_capacity > capacity:                 # Check if room's capacity exceeds the filtered capacity
-                        continue
-                    elif room.max_capacity < min_capacity:                                      # Check if room's capacity is less than the minimum capacity of selected sessions
-                        continue
-                    elif len(formats) > 0 and not room.format in formats:                       # Check if the room's format is in the list of filtered formats
-                        continue
-                    elif len(properties) > 0 and not room.property in properties:               # Check if the room's property is in the list of filtered properties
-                        continue
+        # Only rooms that can host at least one of the selected sessions are offered
+        feasible = 0
+        for session in selected_sessions:
+            feasible |= self.feasibility.rows(session)
 
-                    if room.schedule[day_index][slot_index].session_id == -1:
-                        num_available += 1
+        rows = [i for i in range(len(self.all_rooms)) if room_mask[i] and feasible >> i & 1]
+        counts = self.occupancy.count_free(rows, day_indexes, slot_mask)
 
-            if num_available != 0:
-                compatible_rooms.append((room, num_available))
+        return [(self.all_rooms[rows[i]], counts[i]) for i in range(len(rows)) if counts[i] != 0]
 
-        return compatible_rooms
 
+    # Create a schedule for one day. Intended to be called once each day. With best_fit, each session is offered
+    # to the smallest compatible rooms with a free selected slot first; otherwise rooms are tried in the given order.
+    # Sessions are placed in descending order of their priority, which defaults to their estimated capacity.
+    def create_day_schedule(self, sessions: list[Session], rooms: list[Room], day_index: int, day: datetime, slots: list[datetime], best_fit: bool = True, room_index: RoomIndex = None, priority: dict[int, float] = None):
+        metrics = self.metrics
+        if metrics is not None:
+            started = perf_counter()
+            candidates_seconds = 0.0
+            add_seconds = 0.0
+            add_calls = 0
 
-    # Create a schedule for one day. Intended to be called once each day
-    def create_day_schedule(self, sessions: list[Session], rooms: list[Room], day_index: int, day: datetime, slots: list[datetime]):
         self.days_scheduled += 1
         self.sessions_not_scheduled = []
 
-        # Sort sessions by capacity in descending order
-        sessions.sort(key=lambda x: x.est_capacity, reverse=True)
+        if best_fit and room_index is None:
+            room_index = RoomIndex()
+            room_index.index_init(rooms, self.feasibility)
+
+        slot_mask = self.occupancy.slot_mask(slots)
+
+        # Sort sessions by capacity, or by the given priority, in descending order
+        if priority is None:
+            sessions.sort(key=lambda x: x.est_capacity, reverse=True)
+        else:
+            sessions.sort(key=lambda x: priority[x.session_id], reverse=True)
+
+        if metrics is not None:
+            metrics.add_time('order', perf_counter() - started)
 
         # Loop through sessions
         for sess in sessions:
             is_scheduled = False
 
-            for room in rooms:
+            if self.progress is not None:
+                self.progress(day_index)
+
+            if metrics is not None:
+                tick = perf_counter()
+
+            candidates = room_index.candidates(sess) if best_fit else rooms
+
+            # Rooms left out by the room index are too small or lack the session's equipment
+            if metrics is not None:
+                candidates_seconds += perf_counter() - tick
+                if best_fit:
+                    too_small = bisect_left(room_index.capacities, sess.est_capacity)
+                    metrics.reject('capacity', too_small)
+                    metrics.reject('equipment', len(room_index.rooms) - too_small - len(candidates))
+
+            for room in candidates:
+                if best_fit and self.occupancy.free_bits[room.row * self.occupancy.num_days + day_index] & slot_mask == 0:
+                    if metrics is not None:
+                        metrics.reject('occupied')
+                    continue
+
                 if room.room_id not in self.rooms_sched.keys():
                     self.rooms_sched[room.room_id] = room
 
-                if self.rooms_sched[room.room_id].add_session(sess, day_index, day, slots, self.start_times, self.end_times, self.speaker_log, self.topic_log, self.sponsor_log):
+                if metrics is not None:
+                    tick = perf_counter()
+                    placed = self.rooms_sched[room.room_id].add_session(sess, day_index, day, slots, self.start_times, self.end_times, self.conflict_log, metrics, slot_mask)
+                    add_seconds += perf_counter() - tick
+                    add_calls += 1
+                else:
+                    placed = self.rooms_sched[room.room_id].add_session(sess, day_index, day, slots, self.start_times, self.end_times, self.conflict_log, within=slot_mask)
+
+                if placed:
                     is_scheduled = True
-                    self.sessions_scheduled.append(sess)
+                    self.mark_scheduled(sess)
+                    if best_fit:
+                        room_index.update_equipment(room)
                     break
             
             if not is_scheduled:
                 self.sessions_not_scheduled.append(sess)
 
+        if metrics is not None:
+            metrics.add_time('candidates', candidates_seconds, len(sessions))
+            metrics.add_time('add_session', add_seconds, add_calls)
+            metrics.add_time('create_day_schedule', perf_counter() - started)
+            metrics.sessions_tried += len(sessions)
+            metrics.sessions_placed += len(sessions) - len(self.sessions_not_scheduled)
+            metrics.days_scheduled += 1
+
+
+    # Schedule sessions with one of the backends in solver.py ('greedy', 'cpsat', 'repair', 'multistart' or 'global')
+    # and return its report of sessions placed, wall time, optimality gap and utilization of each day
+    def solve(self, sessions: list[Session], rooms: list[Room], days: list[datetime | int], times: list[datetime | int], backend: str = 'greedy', time_limit: float = 10.0):
+        import solver
+        return solver.solve(self, sessions, rooms, days, times, backend, time_limit)
+
+
+    # Try to place the given sessions that are still unscheduled by moving already placed sessions out of the way,
+    # within a time limit in seconds and/or an iteration budget. Returns the report of solver.improve.
+    def improve(self, sessions: list[Session], rooms: list[Room], days: list[datetime | int], times: list[datetime | int], time_limit: float = None, max_iterations: int = None, seed: int = 0):
+        import solver
+        return solver.improve(self, sessions, rooms, days, times, time_limit, max_iterations, seed)
+
 
-    # Create multiple day schedules. Requires a list of indexes matching the selected indexes of the days list.
-    def create_schedule(self, sessions: list[Session], rooms: list[Room], days: list[datetime], times: list[datetime]):
+    # Create multiple day schedules. Days and times may be given as indexes or datetimes.
+    def create_schedule(self, sessions: list[Session], rooms: list[Room], days: list[datetime | int], times: list[datetime | int], best_fit: bool = True, priority: dict[int, float] = None):
         session_list = sessions
-        slot_indexes = []
+        slot_indexes = [self.get_slot_index(time) for time in times]
+        day_indexes = [self.get_day_index(day) for day in days]
+        room_index = None
         i = 0
 
-        for time in times:
-            slot_indexes.append(self.get_slot_index(time))
+        self.record_run(rooms, day_indexes, slot_indexes)
 
-        while i < len(days) and len(session_list) > 0:
-            day_index = self.get_day_index(days[i])
+        if best_fit:
+            room_index = RoomIndex()
+            room_index.index_init(rooms, self.feasibility)
 
-            self.create_day_schedule(session_list, rooms, day_index, days[i], slot_indexes)
+        while i < len(day_indexes) and len(session_list) > 0:
+            day_index = day_indexes[i]
+
+            self.create_day_schedule(session_list, rooms, day_index, self.days[day_index], slot_indexes, best_fit, room_index, priority)
             session_list = self.sessions_not_scheduled
-            i += 1
\ No newline at end of file
+            i += 1
+
+
+    # Create the schedule of all the given days at once instead of day by day. Sessions are placed in descending
+    # order of their priority (estimated capacity by default) into the smallest compatible room that can take them
+    # on any day, trying the days whose selected slots are least used first. Unlike the day-by-day cascade, the
+    # first day does not fill up with the large sessions before the later days are tried.
+    def create_global_schedule(self, sessions: list[Session], rooms: list[Room], days: list[datetime | int], times: list[datetime | int], priority: dict[int, float] = None):
+        metrics = self.metrics
+        slot_indexes = [self.get_slot_index(time) for time in times]
+        day_indexes = [self.get_day_index(day) for day in days]
+        slot_mask = self.occupancy.slot_mask(slot_indexes)
+        free_bits = self.occupancy.free_bits
+        num_days = self.occupancy.num_days
+
+        self.record_run(rooms, day_indexes, slot_indexes)
+        self.days_scheduled += len(day_indexes)
+        self.sessions_not_scheduled = []
+
+        room_index = RoomIndex()
+        room_index.index_init(rooms, self.feasibility)
+
+        # Selected slots already taken in the given rooms on each day
+        used = [len(rooms) * len(slot_indexes) - sum(count) for count in
+                ([(free_bits[room.row * num_days + day_index] & slot_mask).bit_count() for room in rooms] for day_index in day_indexes)]
+
+        if priority is None:
+            sessions = sorted(sessions, key=lambda x: x.est_capacity, reverse=True)
+        else:
+            sessions = sorted(sessions, key=lambda x: priority[x.session_id], reverse=True)
+
+        for sess in sessions:
+            if self.progress is not None:
+                self.progress(-1)
+
+            is_scheduled = False
+            day_order = sorted(range(len(day_indexes)), key=used.__getitem__)
+
+            for room in room_index.candidates(sess):
+                for k in day_order:
+                    day_index = day_indexes[k]
+                    if free_bits[room.row * num_days + day_index] & slot_mask == 0:
+                        continue
+
+                    if room.add_session(sess, day_index, self.days[day_index], slot_indexes, self.start_times, self.end_times, self.conflict_log, metrics, slot_mask):
+                        self.rooms_sched.setdefault(room.room_id, room)
+                        self.mark_scheduled(sess)
+                        room_index.update_equipment(room)
+                        used[k] += self.get_last_slot(sess) - self.slot_lookup[sess.start_time.time()] + 1
+                        is_scheduled = True
+                        break
+
+                if is_scheduled:
+                    break
+
+            if not is_scheduled:
+                self.sessions_not_scheduled.append(sess)
+
+        if metrics is not None:
+            metrics.sessions_tried += len(sessions)
+            metrics.sessions_placed += len(sessions) - len(self.sessions_not_scheduled)
+            metrics.days_scheduled += len(day_indexes)
+
+
+    # Return the share of the selected slots of the given rooms that are taken on each of the given days
+    def get_utilization(self, rooms: list[Room], days: list[datetime | int], times: list[datetime | int]) -> list[float]:
+        slot_mask = self.occupancy.slot_mask([self.get_slot_index(time) for time in times])
+        cells = len(rooms) * slot_mask.bit_count()
+        utilization = []
+
+        for day in days:
+            day_index = self.get_day_index(day)
+            free = sum((self.occupancy.free_bits[room.row * self.occupancy.num_days + day_index] & slot_mask).bit_count() for room in rooms)
+            utilization.append((cells - free) / cells if cells else 0.0)
+
+        return utilization
+
+
+    # Remember the rooms, days and slots of a scheduling run so incremental edits can re-place sessions there
+    def record_run(self, rooms: list[Room], day_indexes: list[int], slot_indexes: list[int]):
+        for room in rooms:
+            self.run_rooms[room.room_id] = room
+        for day_index in day_indexes:
+            self.run_days[day_index] = None
+        for slot_index in slot_indexes:
+            self.run_slots[slot_index] = None
+
+
+    # Put displaced sessions back. Each session first tries the placement it had, then the rest are scheduled
+    # greedily into the rooms, days and slots of earlier runs. Returns the sessions left unscheduled.
+    def reschedule(self, displaced: list[tuple[Session, tuple[Room, int, int]]]) -> list[Session]:
+        leftover = []
+
+        for sess, placement in displaced:
+            if placement is None or placement[0].room_id not in self.room_lookup or not self.place_session(sess, *placement):
+                leftover.append(sess)
+
+        if leftover and self.run_rooms:
+            self.create_schedule(leftover, list(self.run_rooms.values()), list(self.run_days), list(self.run_slots))
+            leftover = [sess for sess in leftover if self.is_unscheduled(sess.session_id)]
+
+        return leftover
+
+
+    # Take a session out of the schedule and return it with the placement it had, or None if it was unscheduled
+    def displace(self, session: Session) -> tuple[Session, tuple[Room, int, int]]:
+        if self.is_unscheduled(session.session_id):
+            return session, None
+
+        placement = self.get_placement(session)
+        self.unplace_session(session)
+        return session, placement
+
+
+    # Add a new session and try to schedule it. Returns the sessions left unscheduled.
+    def insert_session(self, session: Session) -> list[Session]:
+        if session.session_id in self.session_index:
+            raise ValueError(f'Session {session.session_id} already exists')
+
+        self.all_sessions.append(session)
+        self.session_index[session.session_id] = session
+        self.unscheduled_index[session.session_id] = session
+        self.facet_index.add(session)
+
+        for speaker_id in session.speaker:
+            self.session_speakers.setdefault(session.session_id, []).append(speaker_id)
+            if speaker_id in self.speaker_index:
+                self.speaker_index[speaker_id].session_ids.append(session.session_id)
+
+        return self.reschedule([(session, None)])
+
+
+    # Remove a session, freeing its slot
+    def remove_session(self, id: int):
+        session = self.session_index.pop(id)
+
+        self.displace(session)
+        self.unscheduled_index.pop(id, None)
+        self.all_sessions.remove(session)
+        self.conflict_log.forget(id)
+        self.facet_index.remove(session)
+
+        for speaker_id in self.session_speakers.pop(id, []):
+            if speaker_id in self.speaker_index and id in self.speaker_index[speaker_id].session_ids:
+                self.speaker_index[speaker_id].session_ids.remove(id)
+
+
+    # Change attributes of a session (e.g. speaker=[...], equipment=[...]) and re-place it, keeping its current
+    # placement when it still fits. Returns the sessions left unscheduled.
+    def update_session(self, id: int, **changes) -> list[Session]:
+        if 'session_id' in changes:
+            raise ValueError('The ID of a session cannot be changed')
+
+        session = self.session_index[id]
+        displaced = self.displace(session)
+
+        if 'speaker' in changes:
+            for speaker_id in self.session_speakers.pop(id, []):
+                if speaker_id in self.speaker_index and id in self.speaker_index[speaker_id].session_ids:
+                    self.speaker_index[speaker_id].session_ids.remove(id)
+            for speaker_id in changes['speaker']:
+                self.session_speakers.setdefault(id, []).append(speaker_id)
+                if speaker_id in self.speaker_index:
+                    self.speaker_index[speaker_id].session_ids.append(id)
+
+        self.facet_index.remove(session)
+        for name, value in changes.items():
+            setattr(session, name, value)
+        session.compact()
+        self.facet_index.add(session)
+
+        self.conflict_log.forget(id)
+        return self.reschedule([displaced])
+
+
+    # Add a new room with an empty schedule
+    def insert_room(self, room: Room):
+        if room.room_id in self.room_lookup:
+            raise ValueError(f'Room {room.room_id} already exists')
+
+        room.schedule_init(self.occupancy, self.occupancy.add_row(), self.feasibility)
+        self.all_rooms.append(room)
+        self.room_lookup[room.room_id] = room
+        self.feasibility.clear()
+
+
+    # Remove a room and re-place the sessions that were scheduled in it. Returns the sessions left unscheduled.
+    def remove_room(self, id: int) -> list[Session]:
+        room = self.room_lookup[id]
+        # A session that spans slots shows up in each of them, so each ID is taken once
+        session_ids = dict.fromkeys(room.occupancy.cells[room.occupancy.offset(room.row, 0, 0):room.occupancy.offset(room.row + 1, 0, 0)])
+        displaced = [self.displace(self.session_index[session_id]) for session_id in session_ids if session_id != -1]
+
+        self.occupancy.remove_row(room.row)
+        for other in self.all_rooms:
+            if other.row > room.row:
+                other.row -= 1
+
+        self.all_rooms.remove(room)
+        del self.room_lookup[id]
+        self.rooms_sched.pop(id, None)
+        self.run_rooms.pop(id, None)
+        room.occupancy = None
+        room.row = -1
+        room.feasibility = None
+        self.feasibility.clear()
+
+        return self.reschedule([(sess, None) for sess, placement in displaced])
+
+
+    # Change attributes of a room (e.g. max_capacity=..., equipment=[...]) and re-place the sessions that no
+    # longer fit in it. Returns the sessions left unscheduled.
+    def update_room(self, id: int, **changes) -> list[Session]:
+        if 'room_id' in changes:
+            raise ValueError('The ID of a room cannot be changed')
+
+        room = self.room_lookup[id]
+        for name, value in changes.items():
+            setattr(room, name, value)
+        self.feasibility.clear()
+
+        displaced = []
+        for day_index in range(self.occupancy.num_days):
+            for slot_index in range(self.occupancy.num_slots):
+                session_id = self.occupancy.get(room.row, day_index, slot_index)
+                if session_id != -1 and not room.check_compatible(self.session_index[session_id]):
+                    displaced.append((self.displace(self.session_index[session_id])[0], None))
+
+        return self.reschedule(displaced)
+
+
+    # Set the sessions a speaker presents, re-placing only the sessions whose speakers change. Returns the
+    # sessions left unscheduled.
+    def set_speaker_sessions(self, id: int, session_ids: list[int]) -> list[Session]:
+        speaker = self.speaker_index[id]
+        changed = set(speaker.session_ids).symmetric_difference(session_ids)
+        displaced = []
+
+        speaker.session_ids = list(session_ids)
+
+        for session_id in changed:
+            speaker_ids = [speaker_id for speaker_id in self.session_speakers.get(session_id, []) if speaker_id != id]
+            if session_id in session_ids:
+                speaker_ids.append(id)
+            self.session_speakers[session_id] = speaker_ids
+
+            session = self.session_index.get(session_id)
+            if session is not None:
+                displaced.append(self.displace(session))
+                session.speaker = tuple(speaker_ids)
+                self.conflict_log.forget(session_id)
+
+        return self.reschedule(displaced)
+
+
+    # Add a new speaker to the sessions it presents. Returns the sessions left unscheduled.
+    def insert_speaker(self, speaker: Speaker) -> list[Session]:
+        if speaker.speaker_id in self.speaker_index:
+            raise ValueError(f'Speaker {speaker.speaker_id} already exists')
+
+        session_ids = speaker.session_ids
+        speaker.session_ids = []
+        self.speakers.append(speaker)
+        self.speaker_index[speaker.speaker_id] = speaker
+
+        return self.set_speaker_sessions(speaker.speaker_id, session_ids)
+
+
+    # Remove a speaker from the schedule and from the sessions it presents
+    def remove_speaker(self, id: int):
+        self.set_speaker_sessions(id, [])
+        self.speakers.remove(self.speaker_index.pop(id))
+
+
+    # Change a speaker's name or sessions. Returns the sessions left unscheduled.
+    def update_speaker(self, id: int, **changes) -> list[Session]:
+        if 'speaker_id' in changes:
+            raise ValueError('The ID of a speaker cannot be changed')
+
+        speaker = self.speaker_index[id]
+        for name, value in changes.items():
+            if name != 'session_ids':
+                setattr(speaker, name, value)
+
+        if 'session_ids' in changes:
+            return self.set_speaker_sessions(id, changes['session_ids'])
+
+        return []
@@ -0,0 +1,561 @@
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor, wait
+from dataclasses import dataclass
+import copy
+import multiprocessing
+import os
+import random
+from datetime import datetime
+import time
+
+import schedule
+
+
+# The report of one scheduling run. It lets the planner compare backends by how many sessions were placed,
+# how long it took and, for exact backends, how far the placement may be from the best possible one.
+@dataclass
+class SolverResult:
+    backend: str                # Name of the backend that produced the placement
+    placed: int                 # Number of sessions placed by this run
+    total: int                  # Number of sessions given to this run
+    wall_time: float            # Seconds spent in the run
+    gap: float = None           # Relative optimality gap (0 is proven optimal), or None if the backend cannot tell
+    status: str = ''            # Final status reported by the backend
+    utilization: dict[str, float] = None    # Share of the selected room slots taken on each day, by date
+    repair_rate: float = None   # Sessions placed per second by the local search pass, or None if there was none
+
+
+# Place sessions with the greedy day-by-day cascade of Schedule.create_schedule
+def solve_greedy(sched: schedule.Schedule, sessions: list[schedule.Session], rooms: list[schedule.Room], days: list[datetime | int], times: list[datetime | int], time_limit: float) -> SolverResult:
+    start = time.perf_counter()
+    placed_before = len(sched.sessions_scheduled)
+
+    sched.create_schedule(sessions, rooms, days, times)
+
+    placed = len(sched.sessions_scheduled) - placed_before
+    return SolverResult('greedy', placed, len(sessions), time.perf_counter() - start, None, 'FEASIBLE')
+
+
+# Place sessions over all days at once with Schedule.create_global_schedule, then repair with a local search pass
+# over the sessions left out. The pass gets no more time than the placement took, so the backend stays close to
+# the greedy cascade in run time.
+def solve_global(sched: schedule.Schedule, sessions: list[schedule.Session], rooms: list[schedule.Room], days: list[datetime | int], times: list[datetime | int], time_limit: float) -> SolverResult:
+    start = time.perf_counter()
+    placed_before = len(sched.sessions_scheduled)
+
+    sched.create_global_schedule(sessions, rooms, days, times)
+
+    placed = len(sched.sessions_scheduled) - placed_before
+    elapsed = time.perf_counter() - start
+    repair = improve(sched, sessions, rooms, days, times, min(elapsed, max(time_limit - elapsed, 0.0)), max_iterations=len(sched.sessions_not_scheduled))
+
+    return SolverResult('global', placed + repair.placed, len(sessions), time.perf_counter() - start, None, 'FEASIBLE', repair_rate=repair.rate)
+
+
+# Give the sessions the model selected, as (session ID, day index, start slot index), a room each in the given
+# rooms, smallest compatible room first and in the given order. Returns the IDs of the sessions that got a room.
+def assign_rooms(sched: schedule.Schedule, selected: list[tuple[int, int, int]], room_ids: list[int], slot_mask: int) -> set[int]:
+    rooms = [sched.room_lookup[room_id] for room_id in room_ids]
+    room_index = schedule.RoomIndex()
+    room_index.index_init(rooms, sched.feasibility)
+    chosen = set()
+
+    for session_id, d, t in selected:
+        sess = sched.get_session(session_id)
+        for room in room_index.candidates(sess):
+            if room.add_session(sess, d, sched.days[d], [t], sched.start_times, sched.end_times, sched.conflict_log, sched.metrics, slot_mask):
+                sched.rooms_sched.setdefault(room.room_id, room)
+                sched.mark_scheduled(sess)
+                room_index.update_equipment(room)
+                chosen.add(session_id)
+                break
+
+    return chosen
+
+
+# Make the schedule's placements match those of a copy of it: sessions the copy moved or left out are taken out,
+# then the sessions placed on the copy are placed in the order the copy placed them. The given rooms first take
+# the equipment they ended up with on the copy, so every placement stays compatible.
+def adopt_placements(sched: schedule.Schedule, source: schedule.Schedule, room_ids: list[int]):
+    for room_id in room_ids:
+        sched.room_lookup[room_id].set_equipment(list(source.room_lookup[room_id].equipment))
+
+    for sess in list(sched.sessions_scheduled):
+        other = source.get_session(sess.session_id)
+        if source.is_unscheduled(sess.session_id) or (other.assigned_room, other.start_time) != (sess.assigned_room, sess.start_time):
+            sched.unplace_session(sess)
+
+    for other in source.sessions_scheduled:
+        if sched.is_unscheduled(other.session_id):
+            room, d, t = source.get_placement(other)
+            sched.place_session(sched.get_session(other.session_id), sched.room_lookup[room.room_id], d, t)
+
+
+# Place sessions by solving a CP-SAT model over session x (day, slot) assignments, then give every assigned
+# session a room. The model enforces slot duration, speaker, topic and sponsor non-overlap, and for capacity it
+# requires, for every seating threshold, no more sessions needing that many seats in a slot than free rooms
+# with that many seats. Because rooms are nested by capacity, that makes the room assignment succeed on
+# capacity alone for sessions that take a single slot. A session that spans slots is counted in each slot it
+# covers, but the counts do not require one room to stay free for the whole run, so it can still find no room.
+# Equipment is checked per (session, slot) against the free rooms but not counted in the model, so a session
+# can also lose its room to the equipment a room picked up earlier in the same run. Sessions left without a room
+# get one local search pass, within what is left of the time limit, to find another slot. Both steps run on a
+# copy, whose placement is only adopted if it places at least as many sessions as the greedy placement used as the
+# search hint; otherwise, and when the solver finds no solution within the time limit, the greedy placement is
+# applied instead. The gap is that of the adopted placement against the model's bound, and None for the greedy one.
+def solve_cpsat(sched: schedule.Schedule, sessions: list[schedule.Session], rooms: list[schedule.Room], days: list[datetime | int], times: list[datetime | int], time_limit: float) -> SolverResult:
+    try:
+        from ortools.sat.python import cp_model
+    except ImportError:
+        raise ImportError("The 'cpsat' backend requires OR-Tools (pip install ortools)")
+
+    start = time.perf_counter()
+    day_indexes = [sched.get_day_index(day) for day in days]
+    slot_indexes = [sched.get_slot_index(slot) for slot in times]
+    candidates = [sess for sess in sessions if sched.is_unscheduled(sess.session_id)]
+    conflicts = sched.conflict_log
+    occupancy = sched.occupancy
+
+    model = cp_model.CpModel()
+    assign = {}                 # Maps (session position, day index, start slot index) to the assignment variable
+    by_slot = {}                # Maps (day index, slot index) to the (session position, start slot) pairs running in the slot
+    spans = {}                  # Maps (session position, start slot index) to the last slot the session takes
+    slot_mask = occupancy.slot_mask(slot_indexes)
+
+    # A session starting in a slot runs until the last slot its duration needs, which must be a selected slot too
+    for i in range(len(candidates)):
+        for t in slot_indexes:
+            last = occupancy.span(t, candidates[i].duration)
+            if last != -1 and occupancy.run_mask(t, last) & ~slot_mask == 0:
+                spans[(i, t)] = last
+
+    for d in day_indexes:
+        for t in slot_indexes:
+            for i in range(len(candidates)):
+                sess = candidates[i]
+                last = spans.get((i, t))
+
+                if last is None or conflicts.has_conflict_span(sess, d, t, last):
+                    continue
+
+                run = occupancy.run_mask(t, last)
+                feasible = sched.feasibility.rows(sess)
+                if not any(occupancy.free_bits[room.row * occupancy.num_days + d] & run == run and feasible >> room.row & 1 for room in rooms):
+                    continue
+
+                assign[(i, d, t)] = model.NewBoolVar(f'x_{i}_{d}_{t}')
+                for u in range(t, last + 1):
+                    by_slot.setdefault((d, u), []).append((i, t))
+
+        for t in slot_indexes:
+            running = by_slot.get((d, t), [])
+            free_rooms = [room for room in rooms if occupancy.is_free(room.row, d, t)]
+
+            # For every seating threshold, at most as many sessions as free rooms that can seat them. Only the
+            # smallest threshold between two room capacities is binding, so one constraint per room capacity.
+            if running:
+                room_capacities = sorted(room.max_capacity for room in free_rooms)
+                ordered = sorted(running, key=lambda pair: candidates[pair[0]].est_capacity, reverse=True)
+                needed = []
+
+                for k in range(len(ordered)):
+                    needed.append(assign[(ordered[k][0], d, ordered[k][1])])
+                    available = len(room_capacities) - bisect_left(room_capacities, candidates[ordered[k][0]].est_capacity)
+
+                    if k + 1 == len(ordered) or bisect_left(room_capacities, candidates[ordered[k + 1][0]].est_capacity) != len(room_capacities) - available:
+                        model.Add(cp_model.LinearExpr.Sum(needed) <= available)
+
+            # Speakers, topics and sponsors may appear at most once in the slot
+            groups = {}
+            for i, start_slot in running:
+                sess = candidates[i]
+                keys = [('speaker', speaker) for speaker in sess.speaker] + [('topic', sess.topic)]
+                if sess.sponsors != ('',):
+                    keys += [('sponsor', sponsor) for sponsor in sess.sponsors]
+                for key in set(keys):
+                    groups.setdefault(key, []).append(assign[(i, d, start_slot)])
+
+            for group in groups.values():
+                if len(group) > 1:
+                    model.AddAtMostOne(group)
+
+    # Each session is placed at most once
+    for i in range(len(candidates)):
+        options = [assign[(i, d, t)] for d in day_indexes for t in slot_indexes if (i, d, t) in assign]
+        if len(options) > 1:
+            model.AddAtMostOne(options)
+
+    model.Maximize(cp_model.LinearExpr.Sum(list(assign.values())))
+
+    # Start the search from the greedy placement, computed on a copy so this schedule is left untouched
+    greedy = copy.deepcopy(sched)
+    greedy_sessions = [greedy.get_session(sess.session_id) for sess in candidates]
+    greedy_before = len(greedy.sessions_scheduled)
+    greedy.create_schedule(greedy_sessions, [greedy.all_rooms[room.row] for room in rooms], day_indexes, slot_indexes)
+    greedy_placed = len(greedy.sessions_scheduled) - greedy_before
+    hinted = {(sess.session_id, *greedy.get_placement(sess)[1:]) for sess in greedy.sessions_scheduled[greedy_before:]}
+
+    for (i, d, t), var in assign.items():
+        model.AddHint(var, (candidates[i].session_id, d, t) in hinted)
+
+    # Symmetry breaking in presolve can cut off the hinted placement, so it is disabled to keep the hint usable. A
+    # tenth of the time limit is left for the room assignment and repair pass.
+    solver = cp_model.CpSolver()
+    solver.parameters.symmetry_level = 0
+    solver.parameters.max_time_in_seconds = max(time_limit * 0.9 - (time.perf_counter() - start), 0.1)
+    status = solver.Solve(model)
+
+    placed_before = len(sched.sessions_scheduled)
+    gap = None
+    repair_rate = None
+    status_name = solver.StatusName(status)
+    room_ids = [room.room_id for room in rooms]
+    kept = greedy
+
+    if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        bound = solver.BestObjectiveBound()
+
+        # Sessions that span slots go first since they need a room free for longer, then larger sessions
+        selected = [(i, d, t) for (i, d, t), var in assign.items() if solver.Value(var)]
+        selected.sort(key=lambda entry: (spans[(entry[0], entry[2])] - entry[2], candidates[entry[0]].est_capacity), reverse=True)
+        selected = [(candidates[i].session_id, d, t) for i, d, t in selected]
+
+        # Give every selected session a room, then give the sessions that lost theirs one local search pass to
+        # find another slot in the time left
+        repaired = copy.deepcopy(sched)
+        chosen = assign_rooms(repaired, selected, room_ids, slot_mask)
+        unplaced = [repaired.get_session(sess.session_id) for sess in candidates if sess.session_id not in chosen]
+        repaired_rooms = [repaired.room_lookup[room_id] for room_id in room_ids]
+        repair = improve(repaired, unplaced, repaired_rooms, day_indexes, slot_indexes, max(time_limit - (time.perf_counter() - start), 0), max_iterations=len(unplaced))
+
+        if len(chosen) + repair.placed >= greedy_placed:
+            kept = repaired
+            repair_rate = repair.rate
+            gap = max(bound - len(chosen) - repair.placed, 0) / bound if bound > 0 else 0.0
+
+    # Without a usable model placement, the greedy placement computed for the hint is applied instead
+    adopt_placements(sched, kept, room_ids)
+    sched.sessions_not_scheduled = [sess for sess in candidates if sched.is_unscheduled(sess.session_id)]
+    placed = len(sched.sessions_scheduled) - placed_before
+    if kept is greedy:
+        status_name += ', greedy placement kept'
+
+    return SolverResult('cpsat', placed, len(sessions), time.perf_counter() - start, gap, status_name, repair_rate=repair_rate)
+
+
+# The report of a local search pass over an existing placement
+@dataclass
+class RepairResult:
+    placed: int                 # Number of sessions placed by the pass
+    moves: int                  # Number of already placed sessions moved to make room
+    iterations: int             # Number of placement attempts made
+    wall_time: float            # Seconds spent in the pass
+
+
+    # Sessions placed per second
+    @property
+    def rate(self) -> float:
+        return self.placed / self.wall_time if self.wall_time > 0 else 0.0
+
+
+# State of a local search pass: the schedule being repaired and the rooms, days and slots it may use
+@dataclass
+class LocalSearch:
+    sched: schedule.Schedule                    # Schedule being repaired
+    room_index: schedule.RoomIndex              # Rooms sessions may be moved into, by capacity
+    day_indexes: list[int]                      # Days sessions may be moved into
+    slot_indexes: list[int]                     # Slots sessions may be moved into
+    slot_mask: int                              # Bitset of slot_indexes
+
+
+    # Return, for each day, the bitsets of the slots the session can start in without conflicts, keyed by the
+    # number of slots it takes from there. A session only runs over slots it may be moved into.
+    def open_slots(self, sess: schedule.Session) -> dict[int, dict[int, int]]:
+        conflicts = self.sched.conflict_log
+        occupancy = self.sched.occupancy
+        spans = {}
+
+        for t in self.slot_indexes:
+            last = occupancy.span(t, sess.duration)
+            if last != -1 and occupancy.run_mask(t, last) & ~self.slot_mask == 0:
+                spans[t] = last
+
+        open_slots = {}
+        for d in self.day_indexes:
+            masks = {}
+            for t, last in spans.items():
+                if not conflicts.has_conflict_span(sess, d, t, last):
+                    masks[last - t + 1] = masks.get(last - t + 1, 0) | 1 << t
+            open_slots[d] = masks
+
+        return open_slots
+
+
+    # Place a session into the first free run of slots it fits in, smallest room first
+    def place_anywhere(self, sess: schedule.Session) -> bool:
+        occupancy = self.sched.occupancy
+        open_slots = self.open_slots(sess)
+
+        for room in self.room_index.candidates(sess):
+            for d in self.day_indexes:
+                for length, starts in open_slots[d].items():
+                    mask = occupancy.free_runs(room.row, d, length) & starts
+
+                    if mask and self.sched.place_session(sess, room, d, (mask & -mask).bit_length() - 1):
+                        self.room_index.update_equipment(room)
+                        return True
+
+        return False
+
+
+    # Return the sessions in the slot, in any room, that share a speaker, topic or sponsor with the session
+    def slot_conflicts(self, sess: schedule.Session, day_index: int, slot_index: int) -> list[schedule.Session]:
+        conflicts = self.sched.conflict_log
+        occupancy = self.sched.occupancy
+
+        if not conflicts.has_conflict(sess, day_index, slot_index):
+            return []
+
+        blockers = []
+        for row in range(occupancy.num_rooms):
+            other_id = occupancy.get(row, day_index, slot_index)
+            if other_id != -1 and conflicts.shares_any(sess, self.sched.get_session(other_id)):
+                blockers.append(self.sched.get_session(other_id))
+
+        return blockers
+
+
+    # Move the blocker out of the way, put the session in its place in the room and find the blocker a new
+    # slot. Everything is put back if the blocker cannot be placed again.
+    def eject(self, sess: schedule.Session, blocker: schedule.Session, room: schedule.Room, day_index: int, slot_index: int) -> bool:
+        blocker_room, blocker_day, blocker_slot = self.sched.get_placement(blocker)
+        equipment = list(room.equipment)
+
+        self.sched.unplace_session(blocker)
+        if self.sched.place_session(sess, room, day_index, slot_index):
+            if self.place_anywhere(blocker):
+                self.room_index.update_equipment(room)
+                return True
+
+            # Undo the move, including any equipment the session brought into the room
+            self.sched.unplace_session(sess)
+            room.set_equipment(equipment)
+
+        self.sched.place_session(blocker, blocker_room, blocker_day, blocker_slot)
+        return False
+
+
+    # Place a session either directly or by moving the one session that blocks it to another slot (an ejection
+    # chain of length one). Sessions that span slots are only placed directly. Returns the number of sessions
+    # moved, or -1 if the session could not be placed.
+    def place_with_ejection(self, sess: schedule.Session) -> int:
+        if self.place_anywhere(sess):
+            return 0
+
+        conflicts = self.sched.conflict_log
+        occupancy = self.sched.occupancy
+        rooms = self.room_index.candidates(sess)
+
+        for d in self.day_indexes:
+            for t in self.slot_indexes:
+                if occupancy.span(t, sess.duration) != t:
+                    continue
+
+                # Speaker, topic and sponsor blockers do not depend on the room, so a slot with more than one is skipped
+                slot_blockers = self.slot_conflicts(sess, d, t)
+                if len(slot_blockers) > 1:
+                    continue
+
+                tried = set()
+                for room in rooms:
+                    occupant_id = occupancy.get(room.row, d, t)
+
+                    if slot_blockers:
+                        blocker = slot_blockers[0]
+                        if occupant_id not in (-1, blocker.session_id):
+                            continue
+                    elif occupant_id != -1:
+                        blocker = self.sched.get_session(occupant_id)
+                    else:
+                        continue
+
+                    # The log tells in O(1) whether removing the blocker clears every conflict
+                    if blocker.session_id in tried or conflicts.has_conflict_without(sess, blocker, d, t):
+                        continue
+                    tried.add(blocker.session_id)
+
+                    if self.eject(sess, blocker, room, d, t):
+                        return 1
+
+        return -1
+
+
+# Try to place the unscheduled sessions among the given sessions into the given rooms, days and slots, moving
+# one already placed session out of the way where needed. Sessions are visited in a seeded random order and
+# the pass repeats while it keeps placing sessions, until the time limit (in seconds) or the iteration budget
+# runs out.
+def improve(sched: schedule.Schedule, sessions: list[schedule.Session], rooms: list[schedule.Room], days: list[datetime | int], times: list[datetime | int], time_limit: float = None, max_iterations: int = None, seed: int = 0) -> RepairResult:
+    start = time.perf_counter()
+    pending = [sess for sess in sessions if sched.is_unscheduled(sess.session_id)]
+    rng = random.Random(seed)
+
+    room_index = schedule.RoomIndex()
+    room_index.index_init(rooms, sched.feasibility)
+    slot_indexes = [sched.get_slot_index(slot) for slot in times]
+    search = LocalSearch(sched, room_index, [sched.get_day_index(day) for day in days], slot_indexes, sched.occupancy.slot_mask(slot_indexes))
+
+    placed = 0
+    moves = 0
+    iterations = 0
+    improved = True
+
+    while improved and pending:
+        improved = False
+        rng.shuffle(pending)
+
+        for sess in list(pending):
+            if time_limit is not None and time.perf_counter() - start >= time_limit:
+                break
+            if max_iterations is not None and iterations >= max_iterations:
+                break
+
+            if sched.progress is not None:
+                sched.progress(-1)
+
+            iterations += 1
+            moved = search.place_with_ejection(sess)
+
+            if moved >= 0:
+                pending.remove(sess)
+                placed += 1
+                moves += moved
+                improved = True
+
+    sched.sessions_not_scheduled = [sess for sess in sessions if sched.is_unscheduled(sess.session_id)]
+    return RepairResult(placed, moves, iterations, time.perf_counter() - start)
+
+
+# Place sessions with the greedy cascade, then spend the rest of the time limit on a local search pass
+def solve_repair(sched: schedule.Schedule, sessions: list[schedule.Session], rooms: list[schedule.Room], days: list[datetime | int], times: list[datetime | int], time_limit: float) -> SolverResult:
+    start = time.perf_counter()
+    greedy = solve_greedy(sched, sessions, rooms, days, times, time_limit)
+    repair = improve(sched, sessions, rooms, days, times, max(time_limit - greedy.wall_time, 0.0))
+
+    return SolverResult('repair', greedy.placed + repair.placed, len(sessions), time.perf_counter() - start, None, 'FEASIBLE', repair_rate=repair.rate)
+
+
+# Raised inside a multi-start start that runs past its deadline
+class StartTimedOut(Exception):
+    pass
+
+
+# Run one start of the multi-start search on a private copy of the schedule. Start 0 keeps the plain capacity
+# order; every other start orders sessions by capacity scaled by seeded random noise. Returns the placements in
+# the order they were made, as (session ID, room ID, day index, slot index), or None if the start ran past the
+# deadline (a time.time() value, checked before each session is placed).
+def run_start(sched: schedule.Schedule, session_ids: list[int], room_ids: list[int], day_indexes: list[int], slot_indexes: list[int], seed: int, start_number: int, deadline: float = None) -> list[tuple[int, int, int, int]]:
+    sessions = [sched.get_session(session_id) for session_id in session_ids]
+    rooms = [sched.room_lookup[room_id] for room_id in room_ids]
+    placed_before = len(sched.sessions_scheduled)
+    priority = None
+
+    if start_number > 0:
+        rng = random.Random(seed * 1000003 + start_number)
+        priority = {sess.session_id: sess.est_capacity * rng.uniform(0.5, 1.5) + rng.random() for sess in sessions}
+
+    if deadline is not None:
+        def progress(day_index: int):
+            if time.time() > deadline:
+                raise StartTimedOut()
+        sched.progress = progress
+
+    try:
+        sched.create_schedule(sessions, rooms, day_indexes, slot_indexes, priority=priority)
+    except StartTimedOut:
+        return None
+
+    placements = []
+    for sess in sched.sessions_scheduled[placed_before:]:
+        room, day_index, slot_index = sched.get_placement(sess)
+        placements.append((sess.session_id, room.room_id, day_index, slot_index))
+
+    return placements
+
+
+# Run several orderings of the greedy scheduler in a process pool, each on its own copy of the schedule, and
+# apply the one that places the most sessions. Results depend only on the seed and the number of starts, with
+# ties going to the lowest start number. With a time limit, starts stop at the limit and are dropped, which can
+# make the result depend on machine speed. Start 0, the plain greedy order, is always part of the result: if it
+# did not finish in time it is run again in this process without a limit, so the search never does worse than
+# the greedy scheduler. Workers are started from a fork server (or spawned where there is none) rather than forked
+# from this process, which may be a multithreaded web server holding locks the children would inherit. The
+# schedule's progress callback is called between waits, so a cancelled job stops waiting on its starts.
+def multi_start(sched: schedule.Schedule, sessions: list[schedule.Session], rooms: list[schedule.Room], days: list[datetime | int], times: list[datetime | int], starts: int = None, workers: int = None, seed: int = 0, time_limit: float = None) -> SolverResult:
+    start = time.perf_counter()
+    starts = starts or os.cpu_count() or 1
+    session_ids = [sess.session_id for sess in sessions if sched.is_unscheduled(sess.session_id)]
+    room_ids = [room.room_id for room in rooms]
+    day_indexes = [sched.get_day_index(day) for day in days]
+    slot_indexes = [sched.get_slot_index(slot) for slot in times]
+
+    deadline = time.time() + time_limit if time_limit is not None else None
+
+    # Leaving the pool without waiting keeps starts that overrun the limit from holding up the result; they stop
+    # at their own deadline
+    methods = multiprocessing.get_all_start_methods()
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn'))
+    try:
+        futures = [pool.submit(run_start, sched, session_ids, room_ids, day_indexes, slot_indexes, seed, k, deadline) for k in range(starts)]
+        done, pending = set(), set(futures)
+
+        while pending and (deadline is None or time.time() < deadline):
+            finished_now, pending = wait(pending, timeout=0.2 if deadline is None else min(deadline - time.time(), 0.2))
+            done |= finished_now
+            if sched.progress is not None:
+                sched.progress(-1)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    results = {k: futures[k].result() for k in range(starts) if futures[k] in done}
+    results = {k: placements for k, placements in results.items() if placements is not None}
+    finished = len(results)
+
+    if 0 not in results:
+        results[0] = run_start(copy.deepcopy(sched), session_ids, room_ids, day_indexes, slot_indexes, seed, 0)
+
+    best = max((results[k] for k in sorted(results)), key=len)
+
+    # Replaying the placements in their original order gives rooms the same equipment as in the winning start
+    placed = 0
+    for session_id, room_id, day_index, slot_index in best:
+        placed += sched.place_session(sched.get_session(session_id), sched.room_lookup[room_id], day_index, slot_index)
+
+    sched.sessions_not_scheduled = [sess for sess in sessions if sched.is_unscheduled(sess.session_id)]
+    return SolverResult('multistart', placed, len(sessions), time.perf_counter() - start, None, f'{finished} of {starts} starts finished')
+
+
+# Place sessions with the best of one greedy start per CPU core
+def solve_multi_start(sched: schedule.Schedule, sessions: list[schedule.Session], rooms: list[schedule.Room], days: list[datetime | int], times: list[datetime | int], time_limit: float) -> SolverResult:
+    return multi_start(sched, sessions, rooms, days, times, time_limit=time_limit)
+
+
+# Solver backends selectable by name
+BACKENDS = {
+    'greedy': solve_greedy,
+    'cpsat': solve_cpsat,
+    'repair': solve_repair,
+    'multistart': solve_multi_start,
+    'global': solve_global,
+}
+
+
+# Place sessions with the named backend within the time limit (in seconds) and return its report, including how
+# much of the selected rooms and slots each day uses afterwards
+def solve(sched: schedule.Schedule, sessions: list[schedule.Session], rooms: list[schedule.Room], days: list[datetime | int], times: list[datetime | int], backend: str = 'greedy', time_limit: float = 10.0) -> SolverResult:
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown solver backend '{backend}', expected one of {', '.join(BACKENDS)}")
+
+    result = BACKENDS[backend](sched, sessions, rooms, days, times, time_limit)
+    day_indexes = [sched.get_day_index(day) for day in days]
+    result.utilization = {str(sched.days[day_index].date()): used for day_index, used in zip(day_indexes, sched.get_utilization(rooms, day_indexes, times))}
+    return result
@@ -0,0 +1,250 @@
+from datetime import datetime
+import json
+import sqlite3
+
+import schedule
+
+
+# Tables mirroring the sessions, rooms, speakers and placements of schedules. Every row belongs to the schedule
+# named by schedule_id, so the schedules of several workspaces share one database. A placement has one row per
+# slot the session takes, so a room can only hold one session in a slot and the sessions running in a slot are
+# found through the (day, slot) index whatever their duration. The rooms, days and slots used by the schedule's
+# scheduling runs so far are kept as JSON lists, so incremental edits of a loaded schedule re-place sessions there.
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS schedules (
+    schedule_id TEXT PRIMARY KEY,
+    days TEXT NOT NULL,
+    start_times TEXT NOT NULL,
+    end_times TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    schedule_id TEXT NOT NULL,
+    session_id INTEGER NOT NULL,
+    duration INTEGER NOT NULL,
+    est_capacity INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    format TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    type TEXT NOT NULL,
+    equipment TEXT NOT NULL,
+    PRIMARY KEY (schedule_id, session_id)
+);
+CREATE TABLE IF NOT EXISTS session_sponsors (
+    schedule_id TEXT NOT NULL,
+    session_id INTEGER NOT NULL,
+    sponsor TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (schedule_id, session_id, position)
+);
+CREATE TABLE IF NOT EXISTS rooms (
+    schedule_id TEXT NOT NULL,
+    room_id INTEGER NOT NULL,
+    max_capacity INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    property TEXT NOT NULL,
+    floor INTEGER NOT NULL,
+    format TEXT NOT NULL,
+    equipment TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (schedule_id, room_id)
+);
+CREATE TABLE IF NOT EXISTS speakers (
+    schedule_id TEXT NOT NULL,
+    speaker_id INTEGER NOT NULL,
+    first_name TEXT NOT NULL,
+    last_initial TEXT NOT NULL,
+    PRIMARY KEY (schedule_id, speaker_id)
+);
+CREATE TABLE IF NOT EXISTS session_speakers (
+    schedule_id TEXT NOT NULL,
+    session_id INTEGER NOT NULL,
+    speaker_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (schedule_id, session_id, position)
+);
+CREATE INDEX IF NOT EXISTS session_speakers_by_speaker ON session_speakers (schedule_id, speaker_id);
+CREATE TABLE IF NOT EXISTS placements (
+    schedule_id TEXT NOT NULL,
+    room_id INTEGER NOT NULL,
+    day INTEGER NOT NULL,
+    slot INTEGER NOT NULL,
+    session_id INTEGER NOT NULL,
+    PRIMARY KEY (schedule_id, room_id, day, slot)
+);
+CREATE INDEX IF NOT EXISTS placements_by_slot ON placements (schedule_id, day, slot);
+CREATE INDEX IF NOT EXISTS placements_by_session ON placements (schedule_id, session_id);
+CREATE TABLE IF NOT EXISTS scheduling_runs (
+    schedule_id TEXT PRIMARY KEY,
+    rooms TEXT NOT NULL,
+    days TEXT NOT NULL,
+    slots TEXT NOT NULL
+);
+'''
+
+TABLES = ('schedules', 'sessions', 'session_sponsors', 'rooms', 'speakers', 'session_speakers', 'placements', 'scheduling_runs')
+
+
+# A schedule store keeps schedules in SQLite as rows instead of pickled objects. Saving a schedule replaces all of
+# its rows in a single transaction, loading it rebuilds the Schedule and re-places its sessions, and conflict and
+# availability questions about a saved schedule are answered with indexed queries without loading it.
+class ScheduleStore:
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+
+        with self.connect() as db:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.executescript(SCHEMA)
+
+
+    # Open a connection to the database. Connections are not shared between threads.
+    def connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.db_path, timeout=30)
+        db.execute('PRAGMA synchronous=NORMAL')
+        return db
+
+
+    # Save a schedule under the given ID, replacing what was saved under it before
+    def save(self, schedule_id: str, sched: schedule.Schedule):
+        with self.connect() as db:
+            self.write(db, schedule_id, sched)
+
+
+    # Write the rows of a schedule with an open connection, so the caller can make them part of its own transaction
+    def write(self, db: sqlite3.Connection, schedule_id: str, sched: schedule.Schedule):
+        for table in TABLES:
+            db.execute(f'DELETE FROM {table} WHERE schedule_id = ?', (schedule_id,))
+
+        db.execute('INSERT INTO schedules VALUES (?, ?, ?, ?)', (schedule_id,
+                   json.dumps([day.isoformat() for day in sched.days]),
+                   json.dumps([slot.isoformat() for slot in sched.start_times]),
+                   json.dumps([slot.isoformat() for slot in sched.end_times])))
+
+        db.executemany('INSERT INTO sessions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                       ((schedule_id, sess.session_id, sess.duration, sess.est_capacity, sess.title, sess.format, sess.topic, sess.type, json.dumps(sess.equipment))
+                        for sess in sched.all_sessions))
+        db.executemany('INSERT INTO session_sponsors VALUES (?, ?, ?, ?)',
+                       ((schedule_id, sess.session_id, sponsor, position) for sess in sched.all_sessions for position, sponsor in enumerate(sess.sponsors)))
+        db.executemany('INSERT INTO session_speakers VALUES (?, ?, ?, ?)',
+                       ((schedule_id, sess.session_id, speaker_id, position) for sess in sched.all_sessions for position, speaker_id in enumerate(sess.speaker)))
+        db.executemany('INSERT INTO rooms VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                       ((schedule_id, room.room_id, room.max_capacity, room.name, room.property, room.floor, room.format, json.dumps(room.equipment), position)
+                        for position, room in enumerate(sched.all_rooms)))
+        db.executemany('INSERT INTO speakers VALUES (?, ?, ?, ?)',
+                       ((schedule_id, speaker.speaker_id, speaker.first_name, speaker.last_initial) for speaker in sched.speakers))
+
+        # Placements are read off the occupancy matrix, one row per taken slot
+        occupancy = sched.occupancy
+        db.executemany('INSERT INTO placements VALUES (?, ?, ?, ?, ?)',
+                       ((schedule_id, room.room_id, d, t, session_id)
+                        for room in sched.all_rooms for d in range(occupancy.num_days)
+                        for t, session_id in enumerate(occupancy.day_cells(room.row, d)) if session_id != -1))
+
+        db.execute('INSERT INTO scheduling_runs VALUES (?, ?, ?, ?)', (schedule_id, json.dumps(list(sched.run_rooms)),
+                   json.dumps(list(sched.run_days)), json.dumps(list(sched.run_slots))))
+
+
+    # Return whether a schedule is saved under the given ID
+    def exists(self, schedule_id: str) -> bool:
+        with self.connect() as db:
+            return db.execute('SELECT 1 FROM schedules WHERE schedule_id = ?', (schedule_id,)).fetchone() is not None
+
+
+    # Rebuild the schedule saved under the given ID, with its sessions placed where they were. Returns None if
+    # there is no such schedule.
+    def load(self, schedule_id: str) -> schedule.Schedule:
+        with self.connect() as db:
+            row = db.execute('SELECT days, start_times, end_times FROM schedules WHERE schedule_id = ?', (schedule_id,)).fetchone()
+            if row is None:
+                return None
+
+            days, start_times, end_times = ([datetime.fromisoformat(value) for value in json.loads(column)] for column in row)
+
+            sponsors, speaker_ids, speaker_sessions = {}, {}, {}
+            for session_id, sponsor in db.execute('SELECT session_id, sponsor FROM session_sponsors WHERE schedule_id = ? ORDER BY session_id, position', (schedule_id,)):
+                sponsors.setdefault(session_id, []).append(sponsor)
+            for session_id, speaker_id in db.execute('SELECT session_id, speaker_id FROM session_speakers WHERE schedule_id = ? ORDER BY session_id, position', (schedule_id,)):
+                speaker_ids.setdefault(session_id, []).append(speaker_id)
+                speaker_sessions.setdefault(speaker_id, []).append(session_id)
+
+            pool = {}
+            sessions = [schedule.Session(session_id, duration, est_capacity, title, format, topic, type, sponsors.get(session_id, []), json.loads(equipment), speaker_ids.get(session_id, []), pool=pool)
+                        for session_id, duration, est_capacity, title, format, topic, type, equipment in db.execute(
+                            'SELECT session_id, duration, est_capacity, title, format, topic, type, equipment FROM sessions WHERE schedule_id = ? ORDER BY rowid', (schedule_id,))]
+            rooms = [schedule.Room(room_id, max_capacity, name, property, floor, format, json.loads(equipment))
+                     for room_id, max_capacity, name, property, floor, format, equipment in db.execute(
+                         'SELECT room_id, max_capacity, name, property, floor, format, equipment FROM rooms WHERE schedule_id = ? ORDER BY position', (schedule_id,))]
+            speakers = [schedule.Speaker(speaker_id, first_name, last_initial, speaker_sessions.get(speaker_id, []))
+                        for speaker_id, first_name, last_initial in db.execute(
+                            'SELECT speaker_id, first_name, last_initial FROM speakers WHERE schedule_id = ? ORDER BY rowid', (schedule_id,))]
+
+            # The first slot of each session is where it starts; the slots after it follow from its duration
+            placements = db.execute('SELECT session_id, room_id, day, MIN(slot) FROM placements WHERE schedule_id = ? GROUP BY session_id ORDER BY day, MIN(slot)', (schedule_id,)).fetchall()
+            run = db.execute('SELECT rooms, days, slots FROM scheduling_runs WHERE schedule_id = ?', (schedule_id,)).fetchone()
+
+        sched = schedule.Schedule(start_times, end_times, days, sessions, rooms, speakers)
+        sched.init()
+
+        for session_id, room_id, day, slot in placements:
+            sched.place_session(sched.get_session(session_id), sched.room_lookup[room_id], day, slot)
+
+        if run is not None:
+            room_ids, day_indexes, slot_indexes = (json.loads(column) for column in run)
+            sched.record_run([sched.room_lookup[room_id] for room_id in room_ids], day_indexes, slot_indexes)
+
+        return sched
+
+
+    # Delete the schedule saved under the given ID
+    def delete(self, schedule_id: str):
+        with self.connect() as db:
+            for table in TABLES:
+                db.execute(f'DELETE FROM {table} WHERE schedule_id = ?', (schedule_id,))
+
+
+    # Return the IDs of the sessions running in a slot of a day, in any room
+    def sessions_in_slot(self, schedule_id: str, day: int, slot: int) -> list[int]:
+        with self.connect() as db:
+            return [row[0] for row in db.execute('SELECT session_id FROM placements WHERE schedule_id = ? AND day = ? AND slot = ?', (schedule_id, day, slot))]
+
+
+    # Return the IDs of the sessions running in a slot of a day that share a speaker, the topic or a sponsor with
+    # the given session, which is the set of sessions that keep it out of the slot
+    def conflicts(self, schedule_id: str, session_id: int, day: int, slot: int) -> list[int]:
+        with self.connect() as db:
+            return [row[0] for row in db.execute('''
+                SELECT p.session_id FROM placements p
+                JOIN session_speakers other ON other.schedule_id = p.schedule_id AND other.session_id = p.session_id
+                JOIN session_speakers own ON own.schedule_id = p.schedule_id AND own.speaker_id = other.speaker_id
+                WHERE p.schedule_id = :id AND p.day = :day AND p.slot = :slot AND own.session_id = :session AND p.session_id != :session
+                UNION
+                SELECT p.session_id FROM placements p
+                JOIN sessions other ON other.schedule_id = p.schedule_id AND other.session_id = p.session_id
+                JOIN sessions own ON own.schedule_id = p.schedule_id AND own.topic = other.topic
+                WHERE p.schedule_id = :id AND p.day = :day AND p.slot = :slot AND own.session_id = :session AND p.session_id != :session
+                UNION
+                SELECT p.session_id FROM placements p
+                JOIN session_sponsors other ON other.schedule_id = p.schedule_id AND other.session_id = p.session_id
+                JOIN session_sponsors own ON own.schedule_id = p.schedule_id AND own.sponsor = other.sponsor
+                WHERE p.schedule_id = :id AND p.day = :day AND p.slot = :slot AND own.session_id = :session AND p.session_id != :session AND own.sponsor != ''
+                ''', {'id': schedule_id, 'day': day, 'slot': slot, 'session': session_id})]
+
+
+    # Return the IDs of the rooms seating at least the given number of people that are free in a slot of a day,
+    # smallest first
+    def free_rooms(self, schedule_id: str, day: int, slot: int, min_capacity: int = 0) -> list[int]:
+        with self.connect() as db:
+            return [row[0] for row in db.execute('''
+                SELECT r.room_id FROM rooms r
+                WHERE r.schedule_id = ? AND r.max_capacity >= ? AND NOT EXISTS (
+                    SELECT 1 FROM placements p WHERE p.schedule_id = r.schedule_id AND p.room_id = r.room_id AND p.day = ? AND p.slot = ?)
+                ORDER BY r.max_capacity, r.position''', (schedule_id, min_capacity, day, slot))]
+
+
+    # Return the day, slot, room and session of every slot a speaker presents in, in time order
+    def speaker_placements(self, schedule_id: str, speaker_id: int) -> list[tuple[int, int, int, int]]:
+        with self.connect() as db:
+            return db.execute('''
+                SELECT p.day, p.slot, p.room_id, p.session_id FROM session_speakers s
+                JOIN placements p ON p.schedule_id = s.schedule_id AND p.session_id = s.session_id
+                WHERE s.schedule_id = ? AND s.speaker_id = ?
+                ORDER BY p.day, p.slot''', (schedule_id, speaker_id)).fetchall()
@@ -0,0 +1,89 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+import pickle
+import sqlite3
+import threading
+
+import schedule
+import store
+
+
+# A workspace holds one planner's schedule and the sessions and rooms they selected in the wizard
+@dataclass
+class Workspace:
+    day_schedule: schedule.Schedule = None                                      # Schedule built from the planner's input files
+    selected_sessions: list[schedule.Session] = field(default_factory=list)    # Sessions selected in Step 1
+    selected_rooms: list[schedule.Room] = field(default_factory=list)          # Rooms selected in Step 3
+    version: int = 0                                                            # Number of times the workspace has been saved
+
+
+# A workspace store keeps the most recently used workspaces in memory. With a database path it also writes every
+# saved workspace to SQLite, so workspaces survive restarts and are shared by all worker processes; a worker
+# reloads a cached workspace when another worker has saved a newer version. The schedule of every saved workspace
+# is also written as rows of a schedule store in the same database, under the workspace ID, so it can be queried
+# with SQL.
+class WorkspaceStore:
+    def __init__(self, capacity: int = 32, db_path: str = None):
+        self.capacity = capacity
+        self.db_path = db_path
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.schedules = None
+
+        if db_path is not None:
+            self.schedules = store.ScheduleStore(db_path)
+            with self.connect() as db:
+                db.execute('PRAGMA journal_mode=WAL')
+                db.execute('CREATE TABLE IF NOT EXISTS workspaces (id TEXT PRIMARY KEY, version INTEGER NOT NULL, data BLOB NOT NULL)')
+
+
+    # Open a connection to the database. Connections are not shared between threads.
+    def connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+
+    # Return the workspace with the given ID, or a new empty workspace if there is none
+    def get(self, id: str) -> Workspace:
+        with self.lock:
+            workspace = self.cache.get(id)
+
+        if self.db_path is not None:
+            with self.connect() as db:
+                if workspace is None:
+                    row = db.execute('SELECT data FROM workspaces WHERE id = ?', (id,)).fetchone()
+                else:
+                    row = db.execute('SELECT data FROM workspaces WHERE id = ? AND version > ?', (id, workspace.version)).fetchone()
+
+            if row is not None:
+                workspace = pickle.loads(row[0])
+
+        if workspace is None:
+            workspace = Workspace()
+
+        self.remember(id, workspace)
+        return workspace
+
+
+    # Save a workspace after changing it
+    def save(self, id: str, workspace: Workspace):
+        workspace.version += 1
+
+        if self.db_path is not None:
+            data = pickle.dumps(workspace, protocol=pickle.HIGHEST_PROTOCOL)
+            with self.connect() as db:
+                db.execute('INSERT OR REPLACE INTO workspaces (id, version, data) VALUES (?, ?, ?)', (id, workspace.version, data))
+                if workspace.day_schedule is not None:
+                    self.schedules.write(db, id, workspace.day_schedule)
+
+        self.remember(id, workspace)
+
+
+    # Keep a workspace in memory, dropping the least recently used one when the cache is full. Without a
+    # database, dropped workspaces are gone.
+    def remember(self, id: str, workspace: Workspace):
+        with self.lock:
+            self.cache[id] = workspace
+            self.cache.move_to_end(id)
+
+            while len(self.cache) > self.capacity:
+                self.cache.popitem(last=False)